@@ -0,0 +1,122 @@
+#!/bin/python3
+
+"""
+Replays a control change flood through a MidiListener while notes are held, and reports the memory
+allocated and retained per message with tracemalloc, and the time per message with timeit.
+Queued script invocations are kept instead of run, so what they hold on to is counted too.
+Run it from the repository root, at two commits to compare them:
+    python -m benchmarks.cc_flood_allocations
+It also runs against trees from before the matcher thread, message timestamps and log levels, where
+handleMIDIEvent takes only the event and everything is logged to stdout, which is then discarded.
+"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import os
+import timeit
+import tracemalloc
+from config.mm_config import (
+    getDefaultProfileConfig,
+    SUBPROFILES,
+    GLOBAL_MACROS,
+    MIDI_INPUT,
+)
+from listener.midi_listener import MidiListener
+from parser.parser import parseMacroFile
+from script.script import Script
+
+try:
+    from listener.timeline import Timeline
+except ImportError:
+    Timeline = None
+try:
+    from log.mm_logging import setLogLevel, ERROR
+except ImportError:
+    setLogLevel = None
+
+PROFILE = "benchmark"
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+
+parser = argparse.ArgumentParser(
+    description="allocations per message of a control change flood through MidiListener"
+)
+parser.add_argument("-m", "--messages", type=int, default=20000)
+parser.add_argument("-n", "--held-notes", type=int, default=18)
+parser.add_argument("-r", "--repeat", type=int, default=5)
+args = parser.parse_args()
+
+if setLogLevel:
+    setLogLevel(ERROR)
+    logOutput = contextlib.nullcontext()
+else:
+    logOutput = contextlib.redirect_stdout(open(os.devnull, "w"))
+queued = []
+Script.queue = lambda self, trigger, arguments, *rest: queued.append(
+    (trigger, arguments)
+)
+
+# a script per controller, one matching every control change, and one per held note
+macros = "".join(
+    f"* MIDI{{STATUS==cc}}{{CC_FUNCTION=={controller}}}(DATA_2)→ echo {controller}\n"
+    for controller in range(1, 17)
+)
+macros += "* MIDI{STATUS==cc}(DATA_2)→ echo any\n"
+macros += "".join(
+    f"{note} MIDI{{STATUS==cc}}(DATA_2)→ echo held {note}\n" for note in range(48, 84)
+)
+config = getDefaultProfileConfig()
+config[SUBPROFILES] = {}
+with logOutput:
+    config[GLOBAL_MACROS] = parseMacroFile(io.StringIO(macros), "benchmark", PROFILE)
+config[MIDI_INPUT] = PROFILE
+
+
+def createListener():
+    listener = MidiListener(PROFILE, config, None)
+    # handleMIDIEvent takes the time the event was received once messages are timestamped
+    if len(inspect.signature(listener.handleMIDIEvent).parameters) > 1:
+        timeline = Timeline()
+        handleMIDIEvent = lambda event: listener.handleMIDIEvent(
+            event, timeline.stamp(event[1])
+        )
+    else:
+        handleMIDIEvent = listener.handleMIDIEvent
+    for note in range(48, 48 + args.held_notes * 2, 2):
+        handleMIDIEvent(([NOTE_ON, note, 100], None))
+    return handleMIDIEvent
+
+
+def flood(handleMIDIEvent):
+    for i in range(args.messages):
+        handleMIDIEvent(([CONTROL_CHANGE, 1 + i % 16, i % 128], 0.001))
+
+
+with logOutput:
+    handleMIDIEvent = createListener()
+    queued.clear()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    flood(handleMIDIEvent)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+retained = after.compare_to(before, "filename")
+retainedBytes = sum(stat.size_diff for stat in retained)
+retainedBlocks = sum(stat.count_diff for stat in retained)
+print(f"messages: {args.messages}, held notes: {args.held_notes}, queued: {len(queued)}")
+print(
+    f"retained: {retainedBytes / args.messages:.0f} B/message, {retainedBlocks / args.messages:.2f} blocks/message"
+)
+print(f"peak: {peak / 1e6:.2f} MB")
+
+seconds = []
+with logOutput:
+    for _ in range(args.repeat):
+        handleMIDIEvent = createListener()
+        queued.clear()
+        seconds.append(timeit.timeit(lambda: flood(handleMIDIEvent), number=1))
+print(f"time: {min(seconds) / args.messages * 1e6:.2f} us/message (best of {args.repeat})")
@@ -0,0 +1,80 @@
+#!/bin/python3
+
+"""
+Compares how long a shell script invocation takes when its process is started with Popen and when it is run by
+a SHELL_COPROCESS shell, with and without BLOCK. The script writes a byte to a FIFO, so besides the time until
+the invocation returns, it measures the time until the script has actually been forked, executed and run.
+Run it from the repository root:
+    python -m benchmarks.script_spawn_latency
+"""
+
+import argparse
+import io
+import os
+import select
+import statistics
+import tempfile
+import time
+from log.mm_logging import setLogLevel, ERROR
+from parser.parser import parseMacroFile
+from listener.played_note import PlayedNote
+from listener.timeline import getTimelineTime
+from shell_coprocess.shell_coprocess import shellCoprocesses
+
+PROFILE = "benchmark"
+FLAGS = ("", "[BLOCK]", "[SHELL_COPROCESS]", "[BLOCK|SHELL_COPROCESS]")
+
+parser = argparse.ArgumentParser(
+    description="Popen and SHELL_COPROCESS script invocation latency"
+)
+parser.add_argument("-n", "--invocations", type=int, default=500)
+args = parser.parse_args()
+
+setLogLevel(ERROR)
+fifoDir = tempfile.mkdtemp()
+fifoPath = os.path.join(fifoDir, "ran")
+os.mkfifo(fifoPath)
+# opened for writing too, so neither side blocks in open and writers never see a closed FIFO
+fifo = os.open(fifoPath, os.O_RDWR)
+
+macros = "".join(
+    f"{60 + i} {flags}→ printf x > {fifoPath}\n" for i, flags in enumerate(FLAGS)
+)
+macroTree = parseMacroFile(io.StringIO(macros), "benchmark", PROFILE)
+scripts = [
+    node.getScripts()[0] for node in macroTree.getRoot().getBranches().values()
+]
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[int(len(samples) * fraction)]
+
+
+try:
+    for flags, script in zip(FLAGS, scripts):
+        returned = []
+        ran = []
+        for i in range(args.invocations + 1):
+            invocation = ((PlayedNote(60, 0, 100, getTimelineTime()),), (), None)
+            start = time.perf_counter()
+            script.runInvocations(((time.monotonic(), invocation),))
+            returnedAt = time.perf_counter()
+            select.select([fifo], [], [])
+            ranAt = time.perf_counter()
+            os.read(fifo, 1)
+            # the first invocation starts the coprocess
+            if i:
+                returned.append(returnedAt - start)
+                ran.append(ranAt - start)
+        print(
+            f"{flags or '[]':24} returned: median {statistics.median(returned) * 1e3:.3f} ms,"
+            f" p95 {percentile(returned, 0.95) * 1e3:.3f} ms,"
+            f" ran: median {statistics.median(ran) * 1e3:.3f} ms,"
+            f" p95 {percentile(ran, 0.95) * 1e3:.3f} ms"
+        )
+finally:
+    macroTree.shutdown()
+    shellCoprocesses.shutdown()
+    os.close(fifo)
+    os.remove(fifoPath)
+    os.rmdir(fifoDir)
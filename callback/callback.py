@@ -1,9 +1,10 @@
 class Callback:
-    def __init__(self, profile, callbackType, script, message):
+    def __init__(self, profile, callbackType, script, message, simpleCommand=None):
         self.profile = profile
         self.callbackType = callbackType
         self.script = script
         self.message = message
+        self.simpleCommand = simpleCommand
 
     def getProfile(self):
         return self.profile
@@ -16,3 +17,6 @@ class Callback:
 
     def getMessage(self):
         return self.message
+
+    def getSimpleCommand(self):
+        return self.simpleCommand
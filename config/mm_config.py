@@ -1,4 +1,5 @@
 import tomllib
+from log.mm_logging import LOG_LEVELS
 
 
 class ConfigException(Exception):
@@ -15,9 +16,15 @@ SUBPROFILE = "subprofile"
 
 # shared settings
 ENABLED = "enabled"
+MAX_RUNNING_SCRIPTS = "max-running-scripts"
 
 # global settings
 SOCKET_PATH = "socket-path"
+LOG_LEVEL = "log-level"
+LOG_QUEUE_SIZE = "log-queue-size"
+SCRIPT_WORKERS = "script-workers"
+PYTHON_WORKERS = "python-workers"
+PYTHON_WORKER_PRELOAD = "python-worker-preload"
 
 # profile settings
 MIDI_INPUT = "midi-input"
@@ -28,6 +35,12 @@ ENABLE_CALLBACK = "enable-callback"
 VIRTUAL_SUSTAIN_CALLBACK = "virtual-sustain-callback"
 SUBPROFILE_CALLBACK = "subprofile-callback"
 DEBOUNCE_CALLBACKS = "debounce-callbacks"
+COMPILE_MACROS = "compile-macros"
+INGEST_QUEUE_SIZE = "ingest-queue-size"
+LOG_CONTROL_CHANGES_PER_SECOND = "log-control-changes-per-second"
+LOG_PITCH_BEND_EVERY = "log-pitch-bend-every"
+STALE_AFTER_MS = "stale-after-ms"
+TIMEOUT_MS = "timeout-ms"
 
 # subprofile settings
 MACROS = "macros"
@@ -38,7 +51,15 @@ TRIGGER_TYPES = set((ENABLE_TRIGGER, CYCLE_SUBPROFILES_TRIGGER))
 PROFILES = "profiles"
 SUBPROFILES = "subprofiles"
 
-GLOBAL_SETTINGS = {SOCKET_PATH: str}
+GLOBAL_SETTINGS = {
+    SOCKET_PATH: str,
+    LOG_LEVEL: str,
+    LOG_QUEUE_SIZE: int,
+    SCRIPT_WORKERS: int,
+    PYTHON_WORKERS: int,
+    PYTHON_WORKER_PRELOAD: list,
+    MAX_RUNNING_SCRIPTS: int,
+}
 PROFILE_SETTINGS = {
     ENABLED: bool,
     MIDI_INPUT: str,
@@ -49,6 +70,13 @@ PROFILE_SETTINGS = {
     VIRTUAL_SUSTAIN_CALLBACK: str,
     SUBPROFILE_CALLBACK: str,
     DEBOUNCE_CALLBACKS: bool,
+    COMPILE_MACROS: bool,
+    INGEST_QUEUE_SIZE: int,
+    LOG_CONTROL_CHANGES_PER_SECOND: int,
+    LOG_PITCH_BEND_EVERY: int,
+    MAX_RUNNING_SCRIPTS: int,
+    STALE_AFTER_MS: int,
+    TIMEOUT_MS: int,
 }
 SUBPROFILE_SETTINGS = {ENABLED: bool, MACROS: str}
 SETTINGS = {
@@ -68,11 +96,28 @@ REQUIRED_SETTINGS = {
 
 
 def getDefaultGlobalConfig():
-    return {}
+    return {
+        LOG_LEVEL: "info",
+        LOG_QUEUE_SIZE: 4096,
+        SCRIPT_WORKERS: 32,
+        PYTHON_WORKERS: 2,
+        PYTHON_WORKER_PRELOAD: [],
+        MAX_RUNNING_SCRIPTS: 0,
+    }
 
 
 def getDefaultProfileConfig():
-    return {ENABLED: True, DEBOUNCE_CALLBACKS: True}
+    return {
+        ENABLED: True,
+        DEBOUNCE_CALLBACKS: True,
+        COMPILE_MACROS: False,
+        INGEST_QUEUE_SIZE: 1024,
+        LOG_CONTROL_CHANGES_PER_SECOND: 0,
+        LOG_PITCH_BEND_EVERY: 1,
+        MAX_RUNNING_SCRIPTS: 0,
+        STALE_AFTER_MS: 0,
+        TIMEOUT_MS: 0,
+    }
 
 
 def getDefaultSubprofileConfig():
@@ -115,6 +160,22 @@ def loadConfig(configFilePath):
             raise ConfigException(f"setting: {key}, is not a valid setting")
         verifySettingType(key, value, GLOBAL)
         config[key] = value
+    if config[LOG_LEVEL] not in LOG_LEVELS:
+        raise ConfigException(
+            f"setting: {LOG_LEVEL}, should be one of: {', '.join(LOG_LEVELS)}"
+        )
+    if config[LOG_QUEUE_SIZE] < 1:
+        raise ConfigException(f"setting: {LOG_QUEUE_SIZE}, should be at least 1")
+    if config[SCRIPT_WORKERS] < 1:
+        raise ConfigException(f"setting: {SCRIPT_WORKERS}, should be at least 1")
+    if config[PYTHON_WORKERS] < 1:
+        raise ConfigException(f"setting: {PYTHON_WORKERS}, should be at least 1")
+    if not all(isinstance(module, str) for module in config[PYTHON_WORKER_PRELOAD]):
+        raise ConfigException(
+            f"setting: {PYTHON_WORKER_PRELOAD}, should be a list of module names"
+        )
+    if config[MAX_RUNNING_SCRIPTS] < 0:
+        raise ConfigException(f"setting: {MAX_RUNNING_SCRIPTS}, should not be negative")
     config[PROFILES] = profiles
     verifyRequiredSettingsPresent(config, GLOBAL)
     return config
@@ -133,6 +194,29 @@ def loadProfileConfig(profile, tomlTable):
             raise ConfigException(f"setting: {key}, is not a valid setting", profile)
         verifySettingType(key, value, PROFILE, profile)
         config[key] = value
+    if config[MAX_RUNNING_SCRIPTS] < 0:
+        raise ConfigException(
+            f"setting: {MAX_RUNNING_SCRIPTS}, should not be negative", profile
+        )
+    if config[STALE_AFTER_MS] < 0:
+        raise ConfigException(
+            f"setting: {STALE_AFTER_MS}, should not be negative", profile
+        )
+    if config[TIMEOUT_MS] < 0:
+        raise ConfigException(f"setting: {TIMEOUT_MS}, should not be negative", profile)
+    if config[INGEST_QUEUE_SIZE] < 1:
+        raise ConfigException(
+            f"setting: {INGEST_QUEUE_SIZE}, should be at least 1", profile
+        )
+    if config[LOG_CONTROL_CHANGES_PER_SECOND] < 0:
+        raise ConfigException(
+            f"setting: {LOG_CONTROL_CHANGES_PER_SECOND}, should not be negative",
+            profile,
+        )
+    if config[LOG_PITCH_BEND_EVERY] < 1:
+        raise ConfigException(
+            f"setting: {LOG_PITCH_BEND_EVERY}, should be at least 1", profile
+        )
     config[SUBPROFILES] = subprofiles
     verifyRequiredSettingsPresent(config, PROFILE, profile)
     return config
@@ -0,0 +1,108 @@
+import ast
+from types import CodeType
+
+
+def referencedNames(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            names.update(referencedNames(constant))
+    return names
+
+
+def conjuncts(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        for value in node.values:
+            yield from conjuncts(value)
+    else:
+        yield node
+
+
+def resolveConstant(node, constants):
+    if isinstance(node, ast.Constant):
+        return True, node.value
+    if isinstance(node, ast.Name) and node.id in constants:
+        return True, constants[node.id]
+    return False, None
+
+
+class ExpressionVariables:
+    def __init__(self, getters):
+        self.getters = getters
+
+    def getNames(self):
+        return self.getters.keys()
+
+    def getGetters(self, names):
+        return tuple(
+            (name, self.getters[name]) for name in names if name in self.getters
+        )
+
+
+class PythonExpression:
+    def __init__(self, source):
+        self.source = source
+        self.code = compile(source, "<expression>", "eval")
+        self.names = frozenset(referencedNames(self.code))
+        self.boundGetters = {}
+
+    def getSource(self):
+        return self.source
+
+    def getCode(self):
+        return self.code
+
+    def getNames(self):
+        return self.names
+
+    def getGetters(self, variables):
+        getters = self.boundGetters.get(variables)
+        if getters == None:
+            getters = variables.getGetters(self.names)
+            self.boundGetters[variables] = getters
+        return getters
+
+    def buildNamespace(self, variables, *context):
+        """
+        Only the variables this expression references are computed.
+        """
+        return {name: getter(*context) for name, getter in self.getGetters(variables)}
+
+    def getEqualityConstraints(self, names, constants):
+        """
+        Find the `name == constant` comparisons that must hold for this expression to be true.
+        """
+        constraints = []
+        for node in conjuncts(ast.parse(self.source, mode="eval").body):
+            if not (
+                isinstance(node, ast.Compare)
+                and len(node.ops) == 1
+                and isinstance(node.ops[0], ast.Eq)
+            ):
+                continue
+            left, right = node.left, node.comparators[0]
+            for variable, value in ((left, right), (right, left)):
+                if not isinstance(variable, ast.Name) or variable.id not in names:
+                    continue
+                resolved, constant = resolveConstant(value, constants)
+                if resolved:
+                    constraints.append((variable.id, constant))
+                    break
+        return constraints
+
+    def evaluate(self, globals, locals=None):
+        return eval(self.code, globals, locals)
+
+    def evaluateWith(self, variables, globals, *context):
+        return eval(self.code, globals, self.buildNamespace(variables, *context))
+
+    def __str__(self):
+        return self.source
+
+    def __eq__(self, other):
+        if isinstance(other, PythonExpression):
+            return self.source == other.source
+        return False
+
+    def __hash__(self):
+        return hash(self.source)
@@ -25,7 +25,7 @@ def handleMessage(message, midiMacros):
     if len(message) == 0:
         return failResponse("empty message")
     messageType = message[0]
-    if messageType in (RELOAD, GET_LOADED_PROFILES):
+    if messageType in (RELOAD, GET_LOADED_PROFILES, GET_INFO):
         if len(message) > 1:
             return failResponse(f"{messageType} takes no arguments")
     if messageType == RELOAD:
@@ -36,6 +36,8 @@ def handleMessage(message, midiMacros):
         return handleProfileMessage(message, 1, midiMacros)
     elif messageType == GET_LOADED_PROFILES:
         return successResponse("\n".join(midiMacros.getLoadedProfiles()))
+    elif messageType == GET_INFO:
+        return successResponse(json.dumps(midiMacros.getInfo()))
     return failResponse(f"invalid message type: {messageType}")
 
 
@@ -0,0 +1,73 @@
+from collections import deque
+from threading import Event
+
+
+class MIDIIngestQueue:
+    """
+    Bounded queue between the rtmidi callback thread, which only appends, and the matcher thread, which drains it.
+    Appending to and popping from a deque are atomic, so neither side takes a lock.
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.events = deque()
+        self.wakeUp = Event()
+        self.closed = False
+        self.dropped = 0
+        self.maxDepth = 0
+
+    def put(self, event):
+        depth = len(self.events)
+        if depth >= self.maxSize:
+            self.dropped += 1
+            return False
+        self.events.append(event)
+        if depth >= self.maxDepth:
+            self.maxDepth = depth + 1
+        if not self.wakeUp.is_set():
+            self.wakeUp.set()
+        return True
+
+    def drain(self):
+        """
+        Wait until events are queued or the queue is closed, then remove and return the queued events.
+        """
+        self.wakeUp.wait()
+        self.wakeUp.clear()
+        batch = []
+        try:
+            while len(batch) < self.maxSize:
+                batch.append(self.events.popleft())
+        except IndexError:
+            pass
+        return batch
+
+    def wake(self):
+        """
+        Make a waiting drain return, even if no events are queued.
+        """
+        self.wakeUp.set()
+
+    def close(self):
+        """
+        Make sure no more events will ever be put before calling this function.
+        """
+        self.closed = True
+        self.wakeUp.set()
+
+    def isClosed(self):
+        return self.closed
+
+    def getDropped(self):
+        return self.dropped
+
+    def getInfo(self):
+        return {
+            "queued": len(self.events),
+            "max-queued": self.maxDepth,
+            "size": self.maxSize,
+            "dropped": self.dropped,
+        }
+
+    def __len__(self):
+        return len(self.events)
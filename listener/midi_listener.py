@@ -1,5 +1,5 @@
 import time
-from threading import RLock
+from threading import RLock, Thread
 from rtmidi.midiutil import open_midiinput
 from rtmidi._rtmidi import (
     InvalidPortError,
@@ -7,11 +7,25 @@ from rtmidi._rtmidi import (
     NoDevicesError,
 )
 from aspn import aspn
-from log.mm_logging import loggingContext, logInfo, exceptionStr
+from log.mm_logging import (
+    LogSampler,
+    INFO,
+    isLogged,
+    loggingContext,
+    logInfo,
+    logError,
+    exceptionStr,
+)
 from macro.matching import numNotesInTrigger, testTriggerWithPlayedNotes
 from listener.played_note import PlayedNote
+from listener.pressed_notes import PressedNotes
+from listener.midi_ingest_queue import MIDIIngestQueue
+from listener.timeline import Timeline, eventTimeContext
 from listener.subprofile_holder import SubprofileHolder
+from macro.tree.macro_tree_frontier import MacroTreeFrontier
 from callback.callback import Callback
+from script.simple_command import parseSimpleCommand
+from script.timer_scheduler import timerScheduler
 from config.mm_config import (
     MIDI_INPUT,
     ENABLE_TRIGGER,
@@ -19,30 +33,72 @@ from config.mm_config import (
     ENABLE_CALLBACK,
     VIRTUAL_SUSTAIN_CALLBACK,
     SUBPROFILE_CALLBACK,
+    CALLBACK_TYPES,
     SUBPROFILES,
     GLOBAL_MACROS,
+    COMPILE_MACROS,
+    INGEST_QUEUE_SIZE,
+    LOG_CONTROL_CHANGES_PER_SECOND,
+    LOG_PITCH_BEND_EVERY,
 )
 from script.argument import MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX
 from midi.midi_message import MIDIMessage
 from midi.constants import *
 
+# suppressed log line counts are written once per log sampling window
+SUPPRESSED_FLUSH_INTERVAL = 1
+
 
 class ListenerException(Exception):
     def __init__(self, message):
         self.message = message
 
 
+def evaluatingMessage(pressed, midiMessage, suppressed):
+    midiMessageSpecifier = (
+        f" with MIDI message: {MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX.convert(midiMessage)}"
+        if midiMessage
+        else ""
+    )
+    suppressedSpecifier = (
+        f" ({suppressed} similar line(s) suppressed)" if suppressed else ""
+    )
+    return f"evaluating pressed keys: {' '.join(f'{playedNote.getChannel()}:{aspn.midiNoteToASPN(playedNote.getNote())}' for playedNote in pressed) if pressed else None}{midiMessageSpecifier}{suppressedSpecifier}"
+
+
+def logSampleKey(midiMessage):
+    if midiMessage.getStatus() == CONTROL_CHANGE:
+        return (midiMessage.getChannel(), midiMessage.getData1())
+    return midiMessage.getChannel()
+
+
 class MidiListener:
     def __init__(self, profile, config, callbackQueue):
         self.profile = profile
         self.config = config
         self.callbackQueue = callbackQueue
         subprofiles = self.config[SUBPROFILES]
-        self.subprofileHolder = SubprofileHolder(subprofiles) if subprofiles else None
+        compileMacros = self.config[COMPILE_MACROS]
+        self.subprofileHolder = (
+            SubprofileHolder(subprofiles, compileMacros) if subprofiles else None
+        )
         self.globalMacroTree = self.config[GLOBAL_MACROS]
+        self.globalFrontier = MacroTreeFrontier(self.globalMacroTree, compileMacros)
         self.listenerLock = RLock()
-        self.pressed = []
-        self.queuedReleases = set()
+        self.ingestQueue = MIDIIngestQueue(self.config[INGEST_QUEUE_SIZE])
+        self.timeline = Timeline()
+        # control changes are sampled per channel and controller number, pitch bends per channel
+        self.logSamplers = {
+            CONTROL_CHANGE: LogSampler(
+                maxPerSecond=self.config[LOG_CONTROL_CHANGES_PER_SECOND]
+            ),
+            PITCH_BEND: LogSampler(every=self.config[LOG_PITCH_BEND_EVERY]),
+        }
+        self.suppressedFlushTimer = None
+        self.suppressedFlushDue = False
+        self.reportedDropped = 0
+        self.matcherThread = None
+        self.pressedNotes = PressedNotes()
         self.lastChangeWasAdd = False
         self.pedalDown = [False for _ in range(16)]
         self.virtualPedalDown = False
@@ -62,6 +118,11 @@ class MidiListener:
         self.enableCallback = self.config.get(ENABLE_CALLBACK)
         self.virtualSustainCallback = self.config.get(VIRTUAL_SUSTAIN_CALLBACK)
         self.subprofileCallback = self.config.get(SUBPROFILE_CALLBACK)
+        self.simpleCallbackCommands = {
+            callbackType: parseSimpleCommand(self.config[callbackType])
+            for callbackType in CALLBACK_TYPES
+            if callbackType in self.config
+        }
 
     def toggleEnabled(self):
         with self.listenerLock:
@@ -122,6 +183,8 @@ class MidiListener:
                 "subprofiles": (
                     self.subprofileHolder.getInfo() if self.subprofileHolder else None
                 ),
+                "ingest-queue": self.ingestQueue.getInfo(),
+                "timeline-resyncs": self.timeline.getResyncs(),
             }
 
     def booleanCallbackMessage(self, enabled):
@@ -135,6 +198,7 @@ class MidiListener:
                     ENABLE_CALLBACK,
                     self.enableCallback,
                     self.booleanCallbackMessage(self.enabled),
+                    self.simpleCallbackCommands[ENABLE_CALLBACK],
                 )
             )
 
@@ -146,6 +210,7 @@ class MidiListener:
                     VIRTUAL_SUSTAIN_CALLBACK,
                     self.virtualSustainCallback,
                     self.booleanCallbackMessage(self.virtualPedalDown),
+                    self.simpleCallbackCommands[VIRTUAL_SUSTAIN_CALLBACK],
                 )
             )
 
@@ -157,39 +222,57 @@ class MidiListener:
                     SUBPROFILE_CALLBACK,
                     self.subprofileCallback,
                     self.subprofileHolder.getCurrent(),
+                    self.simpleCallbackCommands[SUBPROFILE_CALLBACK],
                 )
             )
 
     def __call__(self, event, data=None):
-        with self.listenerLock, loggingContext(self.profile):
-            self.handleMIDIEvent(event)
+        # runs on the rtmidi callback thread, which only timestamps and queues the message for the matcher thread
+        _, deltaTime = event
+        self.ingestQueue.put((event, self.timeline.stamp(deltaTime)))
+
+    def matchForever(self):
+        with loggingContext(self.profile):
+            while True:
+                batch = self.ingestQueue.drain()
+                for event, receivedTime in batch:
+                    # scripts measure how stale their invocations are from the event that triggered them
+                    with self.listenerLock, eventTimeContext(receivedTime):
+                        try:
+                            self.handleMIDIEvent(event, receivedTime)
+                        except Exception as exception:
+                            logError(
+                                f"failed to handle MIDI message: {exceptionStr(exception)}"
+                            )
+                self.reportDropped()
+                self.flushSuppressed()
+                if self.ingestQueue.isClosed() and not self.ingestQueue:
+                    break
+
+    def reportDropped(self):
+        dropped = self.ingestQueue.getDropped()
+        if dropped == self.reportedDropped:
+            return
+        logError(
+            f"ingest queue full, dropped {dropped - self.reportedDropped} MIDI message(s)"
+        )
+        self.reportedDropped = dropped
 
     def handleSustainRelease(self):
-        def shouldRelease(nc):
-            if not self.pedalDown[nc[1]]:
-                toRelease.add(nc)
-                return True
-            return False
-
-        toRelease = set()
-        self.queuedReleases = {
-            nc for nc in self.queuedReleases if not shouldRelease(nc)
-        }
+        toRelease = self.pressedNotes.popQueuedReleases(self.pedalDown)
         if len(toRelease) > 0:
             if self.lastChangeWasAdd:
                 self.executeMacros()
                 self.lastChangeWasAdd = False
-            self.pressed = [
-                pn
-                for pn in self.pressed
-                if (pn.getNote(), pn.getChannel()) not in toRelease
-            ]
+            for note, channel in toRelease:
+                self.pressedNotes.release(note, channel)
+            self.resetFrontiers()
 
-    def handleMIDIEvent(self, event):
+    def handleMIDIEvent(self, event, receivedTime):
         message, _ = event
         if not message:
             return
-        message = MIDIMessage(message, time.time_ns())
+        message = MIDIMessage(message, receivedTime)
         self.executeMacros(message)
         statusType = message.getStatus()
         channel = message.getChannel()
@@ -215,31 +298,32 @@ class MidiListener:
         velocity = data_2
         note = data_1
         wasPress = statusType == NOTE_ON and velocity > 0
-        nc = (note, channel)
         if wasPress:
-            if nc in self.queuedReleases:
-                self.queuedReleases.remove(nc)
-            self.pressed.append(PlayedNote(note, channel, velocity, time.time_ns()))
+            self.pressedNotes.press(PlayedNote(note, channel, velocity, receivedTime))
             self.hadExtraMessageSincePress = False
         else:
             if isSustainingOnChannel:
-                self.queuedReleases.add(nc)
+                self.pressedNotes.queueRelease(note, channel)
                 return
             else:
                 if self.lastChangeWasAdd:
                     self.executeMacros()
-                self.pressed = [
-                    pn
-                    for pn in self.pressed
-                    if pn.getNote() != note or pn.getChannel() != channel
-                ]
+                self.pressedNotes.release(note, channel)
+                self.resetFrontiers()
         self.lastChangeWasAdd = wasPress
 
+    def resetFrontiers(self):
+        self.globalFrontier.reset()
+        if self.subprofileHolder:
+            self.subprofileHolder.resetFrontiers()
+
     def testTrigger(self, trigger, triggerLength):
         return (
             trigger
-            and triggerLength == len(self.pressed)
-            and testTriggerWithPlayedNotes(self.pressed, trigger, triggerLength)
+            and triggerLength == len(self.pressedNotes)
+            and testTriggerWithPlayedNotes(
+                self.pressedNotes.getPlayedNotes(), trigger, triggerLength
+            )
         )
 
     def handleTriggers(self):
@@ -257,18 +341,49 @@ class MidiListener:
         with loggingContext(self.profile):
             if (not midiMessage and self.handleTriggers()) or not self.enabled:
                 return
-            midiMessageSpecifier = (
-                f" with MIDI message: {MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX.convert(midiMessage)}"
-                if midiMessage
-                else ""
-            )
-            logInfo(
-                f"evaluating pressed keys: {' '.join(f'{playedNote.getChannel()}:{aspn.midiNoteToASPN(playedNote.getNote())}' for playedNote in self.pressed) if self.pressed else None}{midiMessageSpecifier}"
-            )
-            self.globalMacroTree.executeMacros(self.pressed, self.hadExtraMessageSincePress, midiMessage)
+            pressed = self.pressedNotes.getPlayedNotes()
+            self.logEvaluating(pressed, midiMessage)
+            self.globalFrontier.executeMacros(pressed, self.hadExtraMessageSincePress, midiMessage)
             if not self.subprofileHolder:
                 return
-            self.subprofileHolder.executeMacros(self.pressed, self.hadExtraMessageSincePress, midiMessage)
+            self.subprofileHolder.executeMacros(pressed, self.hadExtraMessageSincePress, midiMessage)
+
+    def logEvaluating(self, pressed, midiMessage):
+        if not isLogged(INFO):
+            return
+        suppressed = 0
+        logSampler = midiMessage and self.logSamplers.get(midiMessage.getStatus())
+        if logSampler:
+            suppressed = logSampler.sample(
+                logSampleKey(midiMessage), midiMessage.getTime()
+            )
+            if suppressed == None:
+                return
+        logInfo(lambda: evaluatingMessage(pressed, midiMessage, suppressed))
+
+    def logSuppressed(self):
+        for status, logSampler in self.logSamplers.items():
+            for key, suppressed in logSampler.popSuppressed():
+                logInfo(
+                    f"suppressed {suppressed} log line(s) for MIDI messages with status: {status:X}, key: {key}"
+                )
+
+    def scheduleSuppressedFlush(self):
+        self.suppressedFlushTimer = timerScheduler.schedule(
+            time.monotonic() + SUPPRESSED_FLUSH_INTERVAL, self.requestSuppressedFlush
+        )
+
+    def requestSuppressedFlush(self):
+        # runs on the timer thread, which leaves the samplers to the matcher thread
+        self.suppressedFlushDue = True
+        self.ingestQueue.wake()
+
+    def flushSuppressed(self):
+        if not self.suppressedFlushDue:
+            return
+        self.suppressedFlushDue = False
+        self.logSuppressed()
+        self.scheduleSuppressedFlush()
 
     def run(self):
         with loggingContext(self.profile):
@@ -276,6 +391,14 @@ class MidiListener:
             self.queueVirtualSustainCallback()
             self.queueSubprofileCallback()
             self.openMIDIPort()
+            # after the first flush, the matcher thread schedules the next one
+            if isLogged(INFO) and any(
+                logSampler.isSampling() for logSampler in self.logSamplers.values()
+            ):
+                self.scheduleSuppressedFlush()
+            # messages received before the matcher thread starts wait in the ingest queue
+            self.matcherThread = Thread(target=self.matchForever, daemon=True)
+            self.matcherThread.start()
 
     def openMIDIPort(self):
         try:
@@ -302,6 +425,13 @@ class MidiListener:
             logInfo("closing midi port")
             self.midiin.close_port()
             del self.midiin
+            logInfo("waiting for queued MIDI messages to be matched")
+            self.ingestQueue.close()
+            self.matcherThread.join()
+            if self.suppressedFlushTimer:
+                timerScheduler.cancel(self.suppressedFlushTimer)
+                self.suppressedFlushTimer = None
+            self.logSuppressed()
             logInfo("waiting for queued script invocations to complete")
             self.globalMacroTree.shutdown()
             if self.subprofileHolder:
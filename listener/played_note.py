@@ -2,15 +2,21 @@ from aspn.aspn import midiNoteToASPN
 
 
 class PlayedNote:
+    __slots__ = ("note", "channel", "velocity", "time", "mask")
+
     def __init__(self, note, channel, velocity, time):
         self.note = note
         self.channel = channel
         self.velocity = velocity
         self.time = time
+        self.mask = 1 << note
 
     def getNote(self):
         return self.note
 
+    def getMask(self):
+        return self.mask
+
     def getASPN(self):
         return midiNoteToASPN(self.note, unicode=False)
 
@@ -0,0 +1,70 @@
+NUM_CHANNELS = 16
+NUM_NOTES = 128
+
+
+class PressedNotes:
+    """
+    Pressed notes in press order, indexed by channel and note so pressing, releasing
+    and queueing a release while sustained do not scan or rebuild the pressed notes.
+    """
+
+    def __init__(self):
+        # press sequence ids of each pressed (channel, note), a note can be pressed again before it is released
+        self.sequenceIds = [[None] * NUM_NOTES for _ in range(NUM_CHANNELS)]
+        # sequence id -> played note, in press order
+        self.notes = {}
+        self.nextSequenceId = 0
+        self.queuedReleases = [set() for _ in range(NUM_CHANNELS)]
+        self.playedNotes = ()
+        self.playedNotesStale = False
+
+    def press(self, playedNote):
+        channel = playedNote.getChannel()
+        note = playedNote.getNote()
+        self.queuedReleases[channel].discard(note)
+        sequenceIds = self.sequenceIds[channel][note]
+        if sequenceIds == None:
+            sequenceIds = self.sequenceIds[channel][note] = []
+        sequenceIds.append(self.nextSequenceId)
+        self.notes[self.nextSequenceId] = playedNote
+        self.nextSequenceId += 1
+        if not self.playedNotesStale:
+            # a press only appends, so the snapshot is extended instead of rebuilt
+            self.playedNotes += (playedNote,)
+
+    def release(self, note, channel):
+        sequenceIds = self.sequenceIds[channel][note]
+        if sequenceIds == None:
+            return
+        self.sequenceIds[channel][note] = None
+        for sequenceId in sequenceIds:
+            del self.notes[sequenceId]
+        self.playedNotesStale = True
+
+    def queueRelease(self, note, channel):
+        self.queuedReleases[channel].add(note)
+
+    def popQueuedReleases(self, pedalDown):
+        """
+        Remove and return the queued releases on every channel whose pedal is up.
+        """
+        released = []
+        for channel, queuedReleases in enumerate(self.queuedReleases):
+            if not queuedReleases or pedalDown[channel]:
+                continue
+            released.extend((note, channel) for note in queuedReleases)
+            self.queuedReleases[channel] = set()
+        return released
+
+    def getPlayedNotes(self):
+        """
+        An immutable snapshot of the pressed notes in press order, extended on press and only rebuilt after a release.
+        It can be shared with scripts without copying.
+        """
+        if self.playedNotesStale:
+            self.playedNotes = tuple(self.notes.values())
+            self.playedNotesStale = False
+        return self.playedNotes
+
+    def __len__(self):
+        return len(self.notes)
@@ -1,14 +1,19 @@
 from config.mm_config import MACROS
 from log.mm_logging import loggingContext, logInfo
+from macro.tree.macro_tree_frontier import MacroTreeFrontier
 
 
 class SubprofileHolder:
-    def __init__(self, subprofiles):
+    def __init__(self, subprofiles, compileMacros=False):
         self.subprofiles = subprofiles
         self.names = tuple(self.subprofiles.keys())
         self.numSubprofiles = len(self.names)
         assert self.numSubprofiles
         self.current = 0
+        self.frontiers = {
+            subprofile: MacroTreeFrontier(subprofileConfig[MACROS], compileMacros)
+            for subprofile, subprofileConfig in self.subprofiles.items()
+        }
 
     def cycle(self):
         if self.numSubprofiles == 1:
@@ -34,7 +39,11 @@ class SubprofileHolder:
 
     def executeMacros(self, pressed, hadExtraMessageSincePress, midiMessage=None):
         with loggingContext(subprofile=self.getCurrent()):
-            self.getCurrentMacroTree().executeMacros(pressed, hadExtraMessageSincePress, midiMessage)
+            self.frontiers[self.getCurrent()].executeMacros(pressed, hadExtraMessageSincePress, midiMessage)
+
+    def resetFrontiers(self):
+        for frontier in self.frontiers.values():
+            frontier.reset()
 
     def getNames(self):
         return self.names
@@ -0,0 +1,62 @@
+import time
+from threading import local
+from contextlib import contextmanager
+
+# the timeline is resynchronized with the monotonic clock if it falls further behind it than this
+MAX_LAG_NS = 1_000_000_000
+# shared by every timeline, so times from different ports and getTimelineTime can be compared
+WALL_CLOCK_OFFSET = time.time_ns() - time.monotonic_ns()
+
+
+# the time of the MIDI event each thread is handling
+currentEvent = local()
+
+
+def getTimelineTime():
+    return time.monotonic_ns() + WALL_CLOCK_OFFSET
+
+
+@contextmanager
+def eventTimeContext(eventTime):
+    previousEventTime = getCurrentEventTime()
+    currentEvent.time = eventTime
+    try:
+        yield None
+    finally:
+        currentEvent.time = previousEventTime
+
+
+def getCurrentEventTime():
+    return getattr(currentEvent, "time", None)
+
+
+class Timeline:
+    """
+    A monotonic timeline for one MIDI port, advanced by the delta times rtmidi reports between messages,
+    so message times are not skewed by how late the callback thread ran or by wall-clock adjustments.
+    Times are offset to match the wall clock when the program started, which only matters for display.
+    """
+
+    def __init__(self):
+        self.last = None
+        self.resyncs = 0
+
+    def stamp(self, deltaTime):
+        now = time.monotonic_ns()
+        if self.last == None or deltaTime == None or deltaTime < 0:
+            stamped = now
+        else:
+            stamped = self.last + round(deltaTime * 1e9)
+            # a message cannot have arrived after it was received
+            if stamped > now:
+                stamped = now
+            elif now - stamped > MAX_LAG_NS:
+                stamped = now
+                self.resyncs += 1
+            if stamped < self.last:
+                stamped = self.last
+        self.last = stamped
+        return stamped + WALL_CLOCK_OFFSET
+
+    def getResyncs(self):
+        return self.resyncs
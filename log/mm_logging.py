@@ -1,17 +1,30 @@
 import sys
-from threading import local
+from collections import deque
+from threading import local, Condition, Thread
 from contextlib import contextmanager
 
+DEBUG = 10
+INFO = 20
+ERROR = 40
+LOG_LEVELS = {"debug": DEBUG, "info": INFO, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", ERROR: "ERROR"}
+NS_PER_SECOND = 1_000_000_000
+
 context = local()
+logLevel = INFO
+logWriter = None
 
 
 @contextmanager
 def loggingContext(profile=None, subprofile=None):
     oldProfile = getProfile()
     oldSubprofile = getSubprofile()
-    setContext(
-        profile if profile else oldProfile, subprofile if subprofile else oldSubprofile
-    )
+    newProfile = profile if profile else oldProfile
+    newSubprofile = subprofile if subprofile else oldSubprofile
+    if newProfile == oldProfile and newSubprofile == oldSubprofile:
+        yield None
+        return
+    setContext(newProfile, newSubprofile)
     try:
         yield None
     finally:
@@ -35,17 +48,45 @@ def exceptionStr(exception):
     return getattr(exception, "message", repr(exception))
 
 
+def setLogLevel(level):
+    global logLevel
+    logLevel = level
+
+
+def isLogged(level):
+    return level >= logLevel
+
+
+def logDebug(message):
+    log(message, DEBUG, sys.stdout)
+
+
 def logInfo(message):
-    log(message, "INFO", sys.stdout)
+    log(message, INFO, sys.stdout)
 
 
 def logError(message):
-    log(message, "ERROR", sys.stderr)
+    log(message, ERROR, sys.stderr)
 
 
 def log(message, level, file):
-    profile = getProfile()
-    subprofile = getSubprofile()
+    """
+    message can be a callable returning the message, so it is only built if it will be written.
+    While the log writer is running it is built on the writer thread, so it must only capture values that do not change.
+    """
+    if level < logLevel:
+        return
+    record = (getProfile(), getSubprofile(), message, level, file)
+    writer = logWriter
+    if writer:
+        writer.put(record)
+        return
+    writeRecord(record)
+
+
+def formatRecord(profile, subprofile, message, level):
+    if callable(message):
+        message = message()
     if profile:
         if subprofile:
             profileSpecifier = f"[{profile}][{subprofile}]: "
@@ -53,4 +94,154 @@ def log(message, level, file):
             profileSpecifier = f"[{profile}]: "
     else:
         profileSpecifier = ""
-    print(f"{profileSpecifier}{level}: {message}", file=file)
+    return f"{profileSpecifier}{LEVEL_NAMES[level]}: {message}"
+
+
+def writeRecord(record):
+    profile, subprofile, message, level, file = record
+    print(formatRecord(profile, subprofile, message, level), file=file)
+
+
+class LogSampler:
+    """
+    Limits a stream of similar log lines to at most maxPerSecond lines per key each second,
+    and to one line in every `every` lines per key. Suppressed lines are counted per key and
+    reported with the next line that is written, or taken with popSuppressed.
+    """
+
+    def __init__(self, maxPerSecond=0, every=1):
+        self.maxPerSecond = maxPerSecond
+        self.every = every
+        # key -> [window start, lines written in window, lines seen, lines suppressed]
+        self.keys = {}
+
+    def isSampling(self):
+        return bool(self.maxPerSecond) or self.every > 1
+
+    def sample(self, key, time):
+        """
+        Returns None if the line should be suppressed, otherwise the number of lines for key suppressed since the last one written.
+        time is in nanoseconds.
+        """
+        state = self.keys.get(key)
+        if state == None:
+            state = self.keys[key] = [time, 0, 0, 0]
+        state[2] += 1
+        if self.maxPerSecond and time - state[0] >= NS_PER_SECOND:
+            state[0] = time
+            state[1] = 0
+        if (self.every > 1 and (state[2] - 1) % self.every) or (
+            self.maxPerSecond and state[1] >= self.maxPerSecond
+        ):
+            state[3] += 1
+            return None
+        state[1] += 1
+        suppressed = state[3]
+        state[3] = 0
+        return suppressed
+
+    def popSuppressed(self):
+        suppressed = []
+        for key, state in self.keys.items():
+            if state[3]:
+                suppressed.append((key, state[3]))
+                state[3] = 0
+        return suppressed
+
+
+class LogWriter:
+    """
+    Writes log records on a background thread so a slow or blocked stdout never stalls the caller.
+    Records below ERROR are dropped and counted when maxQueued records are queued,
+    errors are always queued so none are lost.
+    """
+
+    def __init__(self, maxQueued):
+        self.maxQueued = maxQueued
+        self.records = deque()
+        self.condition = Condition()
+        self.dropped = 0
+        self.reportedDropped = 0
+        self.writerThread = Thread(target=self.writeForever, daemon=True)
+        self.writerThread.start()
+
+    def put(self, record):
+        with self.condition:
+            if (
+                record != None
+                and record[3] < ERROR
+                and len(self.records) >= self.maxQueued
+            ):
+                self.dropped += 1
+                return
+            self.records.append(record)
+            self.condition.notify()
+
+    def writeForever(self):
+        while True:
+            with self.condition:
+                while not self.records:
+                    self.condition.wait()
+                records = self.records
+                self.records = deque()
+            for record in records:
+                # shutdown signal
+                if record == None:
+                    self.flush()
+                    return
+                try:
+                    writeRecord(record)
+                except Exception as exception:
+                    print(
+                        f"ERROR: failed to write log message: {exceptionStr(exception)}",
+                        file=sys.stderr,
+                    )
+            self.flush()
+
+    def flush(self):
+        with self.condition:
+            dropped = self.dropped
+        if dropped != self.reportedDropped:
+            print(
+                f"ERROR: log queue full, dropped {dropped - self.reportedDropped} log message(s)",
+                file=sys.stderr,
+            )
+            self.reportedDropped = dropped
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def setMaxQueued(self, maxQueued):
+        """
+        Records already queued past a smaller maxQueued are still written.
+        """
+        with self.condition:
+            self.maxQueued = maxQueued
+
+    def stop(self):
+        self.put(None)
+        self.writerThread.join()
+
+
+def startLogWriter(maxQueued):
+    global logWriter
+    if logWriter:
+        return
+    logWriter = LogWriter(maxQueued)
+
+
+def setLogQueueSize(maxQueued):
+    writer = logWriter
+    if writer:
+        writer.setMaxQueued(maxQueued)
+
+
+def stopLogWriter():
+    """
+    Write every queued record, then go back to writing synchronously.
+    """
+    global logWriter
+    writer = logWriter
+    if not writer:
+        return
+    logWriter = None
+    writer.stop()
@@ -1,12 +1,32 @@
 class MacroChord:
     def __init__(self, chord):
         self.chord = chord
+        self.notes = tuple(macroNote.getNote() for macroNote in self.chord)
+        self.mask = 0
+        for note in self.notes:
+            self.mask |= 1 << note
+        self.distinctNotes = self.mask.bit_count() == len(self.notes)
+        self.notePredicates = any(
+            macroNote.hasMatchPredicates() for macroNote in self.chord
+        )
         self.matchPredicates = []
         self.tupleRep = None
 
     def getChord(self):
         return self.chord
 
+    def getNotes(self):
+        return self.notes
+
+    def getMask(self):
+        return self.mask
+
+    def hasDistinctNotes(self):
+        return self.distinctNotes
+
+    def hasNotePredicates(self):
+        return self.notePredicates
+
     def getMatchPredicates(self):
         return (matchPredicate for matchPredicate in self.matchPredicates)
 
@@ -13,6 +13,9 @@ class MacroNote:
     def getMatchPredicates(self):
         return (matchPredicate for matchPredicate in self.matchPredicates)
 
+    def hasMatchPredicates(self):
+        return len(self.matchPredicates) > 0
+
     def addMatchPredicates(self, matchPredicates):
         if not matchPredicates:
             return
@@ -1,6 +1,7 @@
 from itertools import islice
 from statistics import mean
 from log.mm_logging import logError
+from expression.expression import ExpressionVariables
 from macro.macro_note import MacroNote
 from macro.macro_chord import MacroChord
 from util.time_util import *
@@ -18,42 +19,140 @@ def numNotesInTrigger(trigger):
             return 0
 
 
+def channelOrChannels(playedNotes):
+    channels = {playedNote.getChannel() for playedNote in playedNotes}
+    return tuple(channels)[0] if len(channels) == 1 else channels
+
+
+def chordChannel(playedNotes, chordStart, chordEnd):
+    return channelOrChannels(islice(playedNotes, chordStart, chordEnd + 1))
+
+
+def chordStartTime(playedNotes, chordStart, chordEnd):
+    return playedNotes[chordStart].getTime()
+
+
+def chordFinishTime(playedNotes, chordStart, chordEnd):
+    return playedNotes[chordEnd].getTime()
+
+
+def chordElapsedTime(playedNotes, chordStart, chordEnd):
+    return playedNotes[chordEnd].getTime() - playedNotes[chordStart].getTime()
+
+
+def chordVelocities(playedNotes, chordStart, chordEnd):
+    return (
+        playedNote.getVelocity()
+        for playedNote in islice(playedNotes, chordStart, chordEnd + 1)
+    )
+
+
+def chordMinVelocity(playedNotes, chordStart, chordEnd):
+    return min(chordVelocities(playedNotes, chordStart, chordEnd))
+
+
+def chordMaxVelocity(playedNotes, chordStart, chordEnd):
+    return max(chordVelocities(playedNotes, chordStart, chordEnd))
+
+
+def chordAverageVelocity(playedNotes, chordStart, chordEnd):
+    return mean(chordVelocities(playedNotes, chordStart, chordEnd))
+
+
+CHORD_VARIABLES = ExpressionVariables(
+    {
+        "CHANNEL": chordChannel,
+        "CHORD_START_TIME": chordStartTime,
+        "CHORD_FINISH_TIME": chordFinishTime,
+        "CHORD_ELAPSED_TIME": chordElapsedTime,
+        "CHORD_MIN_VELOCITY": chordMinVelocity,
+        "CHORD_MAX_VELOCITY": chordMaxVelocity,
+        "CHORD_AVERAGE_VELOCITY": chordAverageVelocity,
+        "c": chordChannel,
+        "cst": chordStartTime,
+        "cft": chordFinishTime,
+        "cet": chordElapsedTime,
+        "cminv": chordMinVelocity,
+        "cmaxv": chordMaxVelocity,
+        "cavgv": chordAverageVelocity,
+    }
+)
+
+
+def noteChannel(playedNotes, position):
+    return playedNotes[position].getChannel()
+
+
+def noteVelocity(playedNotes, position):
+    return playedNotes[position].getVelocity()
+
+
+def noteTime(playedNotes, position):
+    return playedNotes[position].getTime()
+
+
+def noteElapsedTime(playedNotes, position):
+    return (
+        None
+        if position == 0
+        else playedNotes[position].getTime() - playedNotes[position - 1].getTime()
+    )
+
+
+NOTE_VARIABLES = ExpressionVariables(
+    {
+        "CHANNEL": noteChannel,
+        "VELOCITY": noteVelocity,
+        "TIME": noteTime,
+        "ELAPSED_TIME": noteElapsedTime,
+        "c": noteChannel,
+        "v": noteVelocity,
+        "t": noteTime,
+        "et": noteElapsedTime,
+    }
+)
+
+
+def playedNotesMask(playedNotes, start, end):
+    mask = 0
+    for playedNote in islice(playedNotes, start, end):
+        mask |= playedNote.getMask()
+    return mask
+
+
 def testChordWithMacroChord(playedNotes, position, macroChord):
+    chordLength = len(macroChord.getChord())
+    if (
+        position + chordLength > len(playedNotes)
+        or playedNotesMask(playedNotes, position, position + chordLength)
+        != macroChord.getMask()
+    ):
+        return False
+    return testChordWithMatchingMask(playedNotes, position, macroChord)
+
+
+def testChordWithMatchingMask(playedNotes, position, macroChord):
+    """
+    Test a chord against played notes whose combined note mask is already known to equal the chord's.
+    """
     chordLength = len(macroChord.getChord())
     chordStart, chordEnd = position, position + chordLength - 1
-    playedChord = list(
-        zip(
+    # with distinct chord notes an equal mask means the played notes are exactly the chord's notes,
+    # so the notes only need to be paired up if they have predicates of their own
+    if not macroChord.hasDistinctNotes() or macroChord.hasNotePredicates():
+        playedChord = sorted(
             range(chordStart, chordEnd + 1),
-            islice(playedNotes, chordStart, chordEnd + 1),
+            key=lambda position: playedNotes[position].getNote(),
         )
-    )
-    playedChord.sort(key=lambda ip: ip[1].getNote())
-    for macroNote, (position, _) in zip(macroChord.getChord(), playedChord):
-        if not testNoteWithMacroNote(playedNotes, position, macroNote):
-            return False
-    CHANNEL = {ip[1].getChannel() for ip in playedChord}
-    CHANNEL = tuple(CHANNEL)[0] if len(CHANNEL) == 1 else CHANNEL
-    CHORD_START_TIME = playedNotes[chordStart].getTime()
-    CHORD_FINISH_TIME = playedNotes[chordEnd].getTime()
-    CHORD_ELAPSED_TIME = CHORD_FINISH_TIME - CHORD_START_TIME
-
-    def velocityFromIP(ip):
-        return ip[1].getVelocity()
-
-    CHORD_MIN_VELOCITY = min(velocityFromIP(ip) for ip in playedChord)
-    CHORD_MAX_VELOCITY = max(velocityFromIP(ip) for ip in playedChord)
-    CHORD_AVERAGE_VELOCITY = mean(velocityFromIP(ip) for ip in playedChord)
-    c = CHANNEL
-    cst = CHORD_START_TIME
-    cft = CHORD_FINISH_TIME
-    cet = CHORD_ELAPSED_TIME
-    cminv = CHORD_MIN_VELOCITY
-    cmaxv = CHORD_MAX_VELOCITY
-    cavgv = CHORD_AVERAGE_VELOCITY
+        for macroNote, position in zip(macroChord.getChord(), playedChord):
+            if not testNoteWithMacroNote(playedNotes, position, macroNote):
+                return False
     matchPredicate = None
     try:
         for matchPredicate in macroChord.getMatchPredicates():
-            if not eval(matchPredicate):
+            if not matchPredicate.evaluateWith(
+                CHORD_VARIABLES, globals(), playedNotes, chordStart, chordEnd
+            ):
                 return False
     except Exception:
         logMatchPredicateEvaluationError(matchPredicate)
@@ -65,22 +164,12 @@ def testNoteWithMacroNote(playedNotes, position, macroNote):
     playedNote = playedNotes[position]
     if playedNote.getNote() != macroNote.getNote():
         return False
-    CHANNEL = playedNote.getChannel()
-    VELOCITY = playedNote.getVelocity()
-    TIME = playedNote.getTime()
-    ELAPSED_TIME = (
-        None
-        if position == 0
-        else playedNote.getTime() - playedNotes[position - 1].getTime()
-    )
-    c = CHANNEL
-    v = VELOCITY
-    t = TIME
-    et = ELAPSED_TIME
     matchPredicate = None
     try:
         for matchPredicate in macroNote.getMatchPredicates():
-            if not eval(matchPredicate):
+            if not matchPredicate.evaluateWith(
+                NOTE_VARIABLES, globals(), playedNotes, position
+            ):
                 return False
     except Exception:
         logMatchPredicateEvaluationError(matchPredicate)
@@ -1,25 +1,27 @@
 from itertools import accumulate
 from macro.tree.macro_tree_node import MacroTreeNode
-from macro.macro_note import MacroNote
-from macro.macro_chord import MacroChord
-from macro.matching import (
-    testNoteWithMacroNote,
-    testChordWithMacroChord,
-    numNotesInTrigger,
-)
+from macro.tree.script_dispatch_index import ScriptDispatchIndex
+from macro.tree.macro_tree_compiler import CompiledMacroTree
+from macro.matching import numNotesInTrigger
 
 
 class MacroTree:
     def __init__(self):
         self.root = MacroTreeNode()
-        self.triggerlessScripts = []
+        self.triggerlessScripts = ScriptDispatchIndex()
+        self.compiledMacroTree = None
 
     def getRoot(self):
         return self.root
 
+    def getCompiledMacroTree(self):
+        if self.compiledMacroTree == None:
+            self.compiledMacroTree = CompiledMacroTree(self)
+        return self.compiledMacroTree
+
     def addMacroToTree(self, macro):
         if macro.getTriggers() == None:
-            self.triggerlessScripts.append(macro.getScript())
+            self.triggerlessScripts.addScript(macro.getScript())
             return
         currentNode = self.root
         notesTillScriptExecution = list(
@@ -36,58 +38,40 @@ class MacroTree:
                 currentNode = currentNode.setBranch(trigger, MacroTreeNode())
         currentNode.addScript(macro.getScript())
 
-    def executeMacros(self, playedNotes, hadExtraMessageSincePress, midiMessage=None):
+    def executeTriggerlessScripts(self, playedNotes, hadExtraMessageSincePress, midiMessage=None):
         if self.triggerlessScripts and midiMessage:
-            for script in self.triggerlessScripts:
-                script.queueIfShould(playedNotes[:], (midiMessage,), hadExtraMessageSincePress)
-        if not self.root.shouldProcessNumActions(
-            len(playedNotes) + (1 if midiMessage else 0)
-        ):
-            return
-        self.recurseMacroTreeAndExecuteMacros(self.root, 0, playedNotes, hadExtraMessageSincePress, midiMessage)
+            arguments = (midiMessage,)
+            for script in self.triggerlessScripts.getCandidateScripts(midiMessage):
+                script.queueIfShould(playedNotes, arguments, hadExtraMessageSincePress)
 
     def executeScripts(self, currentNode, position, playedNotes, hadExtraMessageSincePress, midiMessage=None):
         keysLeftToProcess = len(playedNotes) - position
-        if not currentNode.getScripts() or (midiMessage and keysLeftToProcess > 0):
-            return
-        arguments = (midiMessage,) if midiMessage else playedNotes[position:]
-        for script in currentNode.getScripts():
-            script.queueIfShould(playedNotes[:position], arguments, hadExtraMessageSincePress)
+        if midiMessage:
+            if keysLeftToProcess > 0 or not currentNode.getMIDIMessageScripts():
+                return
+            scripts = currentNode.getMIDIMessageScripts().getCandidateScripts(midiMessage)
+            arguments = (midiMessage,)
+        else:
+            if not currentNode.getPlayedNotesScripts():
+                return
+            scripts = currentNode.getPlayedNotesScripts()
+            arguments = playedNotes[position:]
+        # played notes are an immutable snapshot, so every script on this node shares the same slices
+        trigger = playedNotes[:position]
+        for script in scripts:
+            script.queueIfShould(trigger, arguments, hadExtraMessageSincePress)
 
-    def recurseMacroTreeAndExecuteMacros(
-        self, currentNode, position, playedNotes, hadExtraMessageSincePress, midiMessage=None
-    ):
-        addedActions = 1 if midiMessage else 0
-        self.executeScripts(currentNode, position, playedNotes, hadExtraMessageSincePress, midiMessage)
-        keysLeftToProcess = len(playedNotes) - position
-        if not keysLeftToProcess:
-            return
-        for trigger, nextNode in currentNode.getBranches().items():
-            match (trigger):
-                case MacroChord():
-                    chordLength = len(trigger.getChord())
-                    if len(
-                        trigger.getChord()
-                    ) > keysLeftToProcess or not nextNode.shouldProcessNumActions(
-                        (keysLeftToProcess - chordLength) + addedActions
-                    ):
-                        continue
-                    if testChordWithMacroChord(playedNotes, position, trigger):
-                        self.recurseMacroTreeAndExecuteMacros(
-                            nextNode, position + chordLength, playedNotes, hadExtraMessageSincePress, midiMessage
-                        )
-                case MacroNote():
-                    if not nextNode.shouldProcessNumActions(
-                        keysLeftToProcess - 1 + addedActions
-                    ):
-                        continue
-                    if testNoteWithMacroNote(playedNotes, position, trigger):
-                        self.recurseMacroTreeAndExecuteMacros(
-                            nextNode, position + 1, playedNotes, hadExtraMessageSincePress, midiMessage
-                        )
+    def getScripts(self):
+        yield from self.triggerlessScripts.getScripts()
+        yield from self.recurseMacroTreeAndGetScripts(self.root)
+
+    def recurseMacroTreeAndGetScripts(self, currentNode):
+        yield from currentNode.getScripts()
+        for nextNode in currentNode.getBranches().values():
+            yield from self.recurseMacroTreeAndGetScripts(nextNode)
 
     def shutdown(self):
-        for script in self.triggerlessScripts:
+        for script in self.triggerlessScripts.getScripts():
             script.shutdown()
         self.recurseMacroTreeAndShutdownScripts(self.root)
 
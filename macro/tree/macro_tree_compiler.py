@@ -0,0 +1,178 @@
+from macro import matching
+from macro.macro_note import MacroNote
+from macro.macro_chord import MacroChord
+from macro.matching import (
+    NOTE_VARIABLES,
+    CHORD_VARIABLES,
+    testChordWithMatchingMask,
+    logMatchPredicateEvaluationError,
+)
+
+# nodes with more distinct branch keys than this dispatch through a dict instead of an if/elif chain
+MAX_INLINE_BRANCH_KEYS = 4
+INDENT = "    "
+
+
+class CompiledMacroTree:
+    """
+    Generates and compiles a specialized consume function for every node of a macro tree.
+    A consume function does what MacroTreeFrontier.consumeNoteAtNode does for its node,
+    with the node's note comparisons, chord masks and match predicates inlined.
+    """
+
+    def __init__(self, macroTree):
+        self.macroTree = macroTree
+        self.lines = []
+        self.namespace = dict(vars(matching))
+        self.namespace["_logMatchPredicateEvaluationError"] = logMatchPredicateEvaluationError
+        self.namespace["_testChordWithMatchingMask"] = testChordWithMatchingMask
+        self.namespace["_NOTE_GETTERS"] = dict(NOTE_VARIABLES.getGetters(NOTE_VARIABLES.getNames()))
+        self.namespace["_CHORD_GETTERS"] = dict(CHORD_VARIABLES.getGetters(CHORD_VARIABLES.getNames()))
+        self.nodeNames = {}
+        self.consumerNames = {}
+        self.generateNode(self.macroTree.getRoot())
+        self.source = "\n".join(self.lines)
+        exec(compile(self.source, "<compiled macro tree>", "exec"), self.namespace)
+        self.consumers = {
+            node: self.namespace[consumerName]
+            for node, consumerName in self.consumerNames.items()
+        }
+
+    def getSource(self):
+        return self.source
+
+    def getConsumer(self, node):
+        return self.consumers[node]
+
+    def bind(self, prefix, value):
+        name = f"_{prefix}_{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def emit(self, depth, line):
+        self.lines.append(f"{INDENT * depth}{line}")
+
+    def getNodeName(self, node):
+        if node not in self.nodeNames:
+            self.nodeNames[node] = self.bind("node", node)
+        return self.nodeNames[node]
+
+    def generateNode(self, node):
+        for nextNode in node.getBranches().values():
+            self.generateNode(nextNode)
+        noteMatchers = {
+            note: self.generateMatcher(node.getNoteBranches(note))
+            for note in node.getBranchNotes()
+        }
+        chordMatchers = {
+            chordLength: {
+                mask: self.generateMatcher(chordBranches[mask])
+                for mask in chordBranches
+            }
+            for chordLength, chordBranches in node.getChordBranches().items()
+        }
+        noteDispatch = self.generateDispatchTable(noteMatchers)
+        chordDispatches = {
+            chordLength: self.generateDispatchTable(matchers)
+            for chordLength, matchers in chordMatchers.items()
+        }
+        consumerName = self.bind("consume", None)
+        self.consumerNames[node] = consumerName
+        self.emit(0, f"def {consumerName}(_playedNotes, _position, _length, _windowMask, _reachedStates):")
+        self.emit(1, "_keysLeftToProcess = _length - _position")
+        if noteMatchers:
+            self.emit(1, "if _keysLeftToProcess == 1:")
+            self.emit(2, "_note = _playedNotes[_position].getNote()")
+            self.generateDispatch(2, "_note", noteMatchers, noteDispatch)
+        for chordLength, matchers in chordMatchers.items():
+            self.emit(1, f"if _keysLeftToProcess == {chordLength}:")
+            self.generateDispatch(
+                2, "_windowMask", matchers, chordDispatches[chordLength]
+            )
+        self.emit(1, "return")
+        self.emit(0, "")
+
+    def generateDispatchTable(self, matchers):
+        if len(matchers) <= MAX_INLINE_BRANCH_KEYS:
+            return None
+        dispatchName = self.bind("dispatch", None)
+        entries = ", ".join(f"{key!r}: {matcherName}" for key, matcherName in matchers.items())
+        self.emit(0, f"{dispatchName} = {{{entries}}}")
+        self.emit(0, "")
+        return dispatchName
+
+    def generateDispatch(self, depth, keyName, matchers, dispatchName):
+        arguments = "(_playedNotes, _position, _length, _reachedStates)"
+        if dispatchName != None:
+            self.emit(depth, f"_matcher = {dispatchName}.get({keyName})")
+            self.emit(depth, "if _matcher != None:")
+            self.emit(depth + 1, f"_matcher{arguments}")
+            return
+        keyword = "if"
+        for key, matcherName in matchers.items():
+            self.emit(depth, f"{keyword} {keyName} == {key!r}:")
+            self.emit(depth + 1, f"{matcherName}{arguments}")
+            keyword = "elif"
+
+    def generateReached(self, depth, nextNode):
+        self.emit(depth, f"_reachedStates.append([{self.getNodeName(nextNode)}, _length, 0])")
+
+    def generateMatcher(self, branches):
+        # tests are generated first so their definitions are not nested in the matcher
+        tests = [(self.generateTest(trigger), nextNode) for trigger, nextNode in branches]
+        matcherName = self.bind("match", None)
+        self.emit(0, f"def {matcherName}(_playedNotes, _position, _length, _reachedStates):")
+        for test, nextNode in tests:
+            if test == None:
+                self.generateReached(1, nextNode)
+                continue
+            self.emit(1, f"if {test}:")
+            self.generateReached(2, nextNode)
+        self.emit(1, "return")
+        self.emit(0, "")
+        return matcherName
+
+    def generateTest(self, trigger):
+        match (trigger):
+            case MacroNote():
+                if not trigger.hasMatchPredicates():
+                    return None
+                testName = self.generatePredicateTest(
+                    trigger, "_NOTE_GETTERS", NOTE_VARIABLES, "(_playedNotes, _position)"
+                )
+            case MacroChord():
+                if not trigger.hasDistinctNotes() or trigger.hasNotePredicates():
+                    chordName = self.bind("chord", trigger)
+                    return f"_testChordWithMatchingMask(_playedNotes, _position, {chordName})"
+                if not any(True for _ in trigger.getMatchPredicates()):
+                    return None
+                testName = self.generatePredicateTest(
+                    trigger,
+                    "_CHORD_GETTERS",
+                    CHORD_VARIABLES,
+                    "(_playedNotes, _position, _chordEnd)",
+                    f"_chordEnd = _position + {len(trigger.getChord()) - 1}",
+                )
+        return f"{testName}(_playedNotes, _position)"
+
+    def generatePredicateTest(self, trigger, gettersName, variables, context, setup=None):
+        testName = self.bind("test", None)
+        self.emit(0, f"def {testName}(_playedNotes, _position):")
+        if setup:
+            self.emit(1, setup)
+        for matchPredicate in trigger.getMatchPredicates():
+            predicateName = self.bind("predicate", matchPredicate)
+            self.emit(1, "try:")
+            for name, _ in matchPredicate.getGetters(variables):
+                self.emit(2, f"{name} = {gettersName}[{name!r}]{context}")
+            # the predicate goes on its own lines so a trailing comment cannot swallow the closing parenthesis
+            self.emit(2, "if not (")
+            self.lines.append(matchPredicate.getSource())
+            self.emit(2, "):")
+            self.emit(3, "return False")
+            self.emit(1, "except Exception:")
+            self.emit(2, f"_logMatchPredicateEvaluationError({predicateName})")
+            self.emit(2, "return False")
+        self.emit(1, "return True")
+        self.emit(0, "")
+        return testName
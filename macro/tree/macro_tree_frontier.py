@@ -0,0 +1,82 @@
+from macro.matching import testNoteWithMacroNote, testChordWithMatchingMask
+
+
+class MacroTreeFrontier:
+    """
+    Tracks every (node, position) a macro tree can be in after consuming the first position pressed notes.
+    Pressing a note only advances the live frontier instead of re-walking the tree from the root.
+    The frontier must be reset whenever pressed notes are removed.
+    """
+
+    def __init__(self, macroTree, compiled=False):
+        self.macroTree = macroTree
+        if compiled:
+            self.consumeNoteAtNode = self.consumeNoteAtNodeCompiled
+            self.compiledMacroTree = macroTree.getCompiledMacroTree()
+        self.reset()
+
+    def reset(self):
+        # [node, position, note mask of the played notes since position]
+        self.states = [[self.macroTree.getRoot(), 0, 0]]
+        self.consumed = 0
+
+    def advance(self, playedNotes):
+        while self.consumed < len(playedNotes):
+            self.consumeNote(playedNotes, self.consumed)
+            self.consumed += 1
+
+    def consumeNote(self, playedNotes, index):
+        playedNote = playedNotes[index]
+        length = index + 1
+        liveStates = []
+        reachedStates = []
+        for state in self.states:
+            node, position, windowMask = state
+            keysLeftToProcess = length - position
+            # no script at or below this node can accept this many more notes
+            if keysLeftToProcess > node.getMaxActionsTillScriptExecution():
+                continue
+            liveStates.append(state)
+            windowMask |= playedNote.getMask()
+            state[2] = windowMask
+            self.consumeNoteAtNode(
+                node, playedNotes, position, length, windowMask, reachedStates
+            )
+        liveStates.extend(reachedStates)
+        self.states = liveStates
+
+    def consumeNoteAtNode(
+        self, node, playedNotes, position, length, windowMask, reachedStates
+    ):
+        keysLeftToProcess = length - position
+        if keysLeftToProcess == 1:
+            for trigger, nextNode in node.getNoteBranches(playedNotes[position].getNote()):
+                if testNoteWithMacroNote(playedNotes, position, trigger):
+                    reachedStates.append([nextNode, length, 0])
+        chordBranches = node.getChordBranches().get(keysLeftToProcess)
+        if not chordBranches:
+            return
+        for trigger, nextNode in chordBranches.get(windowMask, ()):
+            if testChordWithMatchingMask(playedNotes, position, trigger):
+                reachedStates.append([nextNode, length, 0])
+
+    def consumeNoteAtNodeCompiled(
+        self, node, playedNotes, position, length, windowMask, reachedStates
+    ):
+        self.compiledMacroTree.getConsumer(node)(
+            playedNotes, position, length, windowMask, reachedStates
+        )
+
+    def executeMacros(self, playedNotes, hadExtraMessageSincePress, midiMessage=None):
+        self.advance(playedNotes)
+        self.macroTree.executeTriggerlessScripts(
+            playedNotes, hadExtraMessageSincePress, midiMessage
+        )
+        if not self.macroTree.getRoot().shouldProcessNumActions(
+            len(playedNotes) + (1 if midiMessage else 0)
+        ):
+            return
+        for node, position, _ in self.states:
+            self.macroTree.executeScripts(
+                node, position, playedNotes, hadExtraMessageSincePress, midiMessage
+            )
@@ -1,15 +1,35 @@
 import math
+from macro.macro_note import MacroNote
+from macro.macro_chord import MacroChord
+from macro.tree.script_dispatch_index import ScriptDispatchIndex
 
 
 class MacroTreeNode:
     def __init__(self):
         self.branches = dict()
+        self.noteBranches = dict()
+        self.chordBranches = dict()
         self.scripts = []
+        self.playedNotesScripts = []
+        self.midiMessageScripts = ScriptDispatchIndex()
         self.minActionsTillScriptExecution = math.inf
         self.maxActionsTillScriptExecution = 0
 
     def setBranch(self, trigger, nextNode):
         self.branches[trigger] = nextNode
+        match (trigger):
+            case MacroNote():
+                self.noteBranches.setdefault(trigger.getNote(), []).append(
+                    (trigger, nextNode)
+                )
+            case MacroChord():
+                chordLength = len(trigger.getChord())
+                if chordLength not in self.chordBranches:
+                    self.chordBranches[chordLength] = {}
+                    self.chordBranches = dict(sorted(self.chordBranches.items()))
+                self.chordBranches[chordLength].setdefault(trigger.getMask(), []).append(
+                    (trigger, nextNode)
+                )
         return nextNode
 
     def hasBranch(self, trigger):
@@ -21,13 +41,35 @@ class MacroTreeNode:
     def getBranches(self):
         return self.branches
 
+    def getBranchNotes(self):
+        return self.noteBranches.keys()
+
+    def getNoteBranches(self, note):
+        return self.noteBranches.get(note, ())
+
+    def getChordBranches(self):
+        """
+        Chord branches grouped by ascending chord length, then keyed by the chord's note mask.
+        """
+        return self.chordBranches
+
     def addScript(self, script):
         self.updateActionsTillScriptExecution(script.getArgumentDefinition())
         self.scripts.append(script)
+        if script.hasMIDIMessageArgumentDefinition():
+            self.midiMessageScripts.addScript(script)
+        else:
+            self.playedNotesScripts.append(script)
 
     def getScripts(self):
         return self.scripts
 
+    def getPlayedNotesScripts(self):
+        return self.playedNotesScripts
+
+    def getMIDIMessageScripts(self):
+        return self.midiMessageScripts
+
     def updateMinActionsTillScriptExecution(self, notes):
         self.minActionsTillScriptExecution = min(
             self.minActionsTillScriptExecution, notes
@@ -46,6 +88,9 @@ class MacroTreeNode:
             argumentDefinition.getArgumentNumberRange().getUpperBound() + offset
         )
 
+    def getMaxActionsTillScriptExecution(self):
+        return self.maxActionsTillScriptExecution
+
     def shouldProcessNumActions(self, notes):
         return (
             self.minActionsTillScriptExecution
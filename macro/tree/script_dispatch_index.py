@@ -0,0 +1,57 @@
+from script.argument import UNCONSTRAINED, getMessageDispatchKey
+
+
+class ScriptDispatchIndex:
+    """
+    Indexes MIDI-message scripts by the STATUS, CHANNEL and DATA_1 values their match predicates require,
+    so only scripts that can match a message are tested against it.
+    """
+
+    def __init__(self):
+        self.scripts = []
+        self.buckets = {}
+
+    def addScript(self, script):
+        dispatchKey = script.getArgumentDefinition().getDispatchKey()
+        order = len(self.scripts)
+        self.scripts.append(script)
+        if dispatchKey == None:
+            return
+        constrainedFields = tuple(
+            value is not UNCONSTRAINED for value in dispatchKey
+        )
+        bucketKey = tuple(value for value in dispatchKey if value is not UNCONSTRAINED)
+        self.buckets.setdefault(constrainedFields, {}).setdefault(bucketKey, []).append(
+            (order, script)
+        )
+
+    def getScripts(self):
+        return self.scripts
+
+    def getCandidateScripts(self, midiMessage):
+        messageDispatchKey = getMessageDispatchKey(midiMessage)
+        matchingBuckets = []
+        for constrainedFields, bucketsByKey in self.buckets.items():
+            bucketKey = tuple(
+                value
+                for value, constrained in zip(messageDispatchKey, constrainedFields)
+                if constrained
+            )
+            bucket = bucketsByKey.get(bucketKey)
+            if bucket:
+                matchingBuckets.append(bucket)
+        if not matchingBuckets:
+            return ()
+        if len(matchingBuckets) == 1:
+            return (script for _, script in matchingBuckets[0])
+        # keep the order scripts were defined in
+        return (
+            script
+            for _, script in sorted(
+                (orderedScript for bucket in matchingBuckets for orderedScript in bucket),
+                key=lambda orderedScript: orderedScript[0],
+            )
+        )
+
+    def __len__(self):
+        return len(self.scripts)
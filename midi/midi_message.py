@@ -1,4 +1,6 @@
 class MIDIMessage:
+    __slots__ = ("message", "data_0", "data_1", "data_2", "status", "channel", "time")
+
     def __init__(self, message, time):
         self.message = message
         assert len(self.message) > 0
@@ -34,12 +34,34 @@ from config.mm_config import (
     MACROS,
     TRIGGER_TYPES,
     DEBOUNCE_CALLBACKS,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    SCRIPT_WORKERS,
+    PYTHON_WORKERS,
+    PYTHON_WORKER_PRELOAD,
+    MAX_RUNNING_SCRIPTS,
+    STALE_AFTER_MS,
+    TIMEOUT_MS,
     loadConfig,
     ConfigException,
 )
-from log.mm_logging import loggingContext, logInfo, logError, exceptionStr
+from log.mm_logging import (
+    LOG_LEVELS,
+    loggingContext,
+    logInfo,
+    logError,
+    exceptionStr,
+    setLogLevel,
+    setLogQueueSize,
+    startLogWriter,
+    stopLogWriter,
+)
 from locking.locking import clearLocks
 from script.script_error import ScriptError
+from script.script_executor import scriptExecutor
+from script.process_reaper import processReaper
+from python_worker.python_worker_pool import pythonWorkerPools
+from shell_coprocess.shell_coprocess import shellCoprocesses
 from macro.macro_error import MacroError
 
 
@@ -74,6 +96,8 @@ class MidiMacros:
                 )
                 open(self.configFilePath, "a").close()
         self.initConfig()
+        # from here on log messages are written on a background thread
+        startLogWriter(self.config[LOG_QUEUE_SIZE])
         self.callbackQueue = Queue()
         self.callbackThread = Thread(target=self.executeCallbacksForever, daemon=True)
         self.callbackThread.start()
@@ -103,13 +127,14 @@ class MidiMacros:
 
     def executeCallback(self, callback):
         try:
+            simpleCommand = callback.getSimpleCommand()
             subprocess.Popen(
-                callback.getScript(),
+                simpleCommand if simpleCommand else callback.getScript(),
                 stdin=subprocess.PIPE,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 text=True,
-                shell=True,
+                shell=not simpleCommand,
                 start_new_session=True,
             ).communicate(callback.getMessage())
         except Exception as exception:
@@ -124,6 +149,10 @@ class MidiMacros:
     def shutdown(self):
         logInfo("stopping listeners")
         self.stopListeners()
+        logInfo("stopping python workers")
+        pythonWorkerPools.shutdown()
+        logInfo("stopping shell coprocesses")
+        shellCoprocesses.shutdown()
         logInfo("waiting for callbacks to complete")
         self.callbackQueue.join()
         clearLocks()
@@ -149,6 +178,31 @@ class MidiMacros:
             self.parseControlTriggers(tempConfig)
             self.buildMacroTrees(tempConfig)
             self.config = tempConfig
+            setLogLevel(LOG_LEVELS[self.config[LOG_LEVEL]])
+            setLogQueueSize(self.config[LOG_QUEUE_SIZE])
+            scriptExecutor.setMaxWorkers(self.config[SCRIPT_WORKERS])
+            scriptExecutor.setDefaultStaleAfter(
+                {
+                    profile: profileConfig[STALE_AFTER_MS] / 1000
+                    for profile, profileConfig in self.config[PROFILES].items()
+                }
+            )
+            pythonWorkerPools.configure(
+                self.config[PYTHON_WORKERS], self.config[PYTHON_WORKER_PRELOAD]
+            )
+            processReaper.configure(
+                self.config[MAX_RUNNING_SCRIPTS],
+                {
+                    profile: profileConfig[MAX_RUNNING_SCRIPTS]
+                    for profile, profileConfig in self.config[PROFILES].items()
+                },
+            )
+            processReaper.setDefaultTimeout(
+                {
+                    profile: profileConfig[TIMEOUT_MS] / 1000
+                    for profile, profileConfig in self.config[PROFILES].items()
+                }
+            )
             return True
         except ConfigException as configException:
             with loggingContext(configException.profile, configException.subprofile):
@@ -211,12 +265,15 @@ class MidiMacros:
                 if triggerType in profileConfig:
                     self.parseControlTrigger(profileConfig, triggerType, profile)
 
-    def buildMacroTree(self, macroFilePath, profile, subprofile=None):
+    def buildMacroTree(self, macroFilePath, defaultStaleAfter, profile, subprofile=None):
         try:
             with open(macroFilePath, "r") as macroFile:
-                return parseMacroFile(
+                macroTree = parseMacroFile(
                     macroFile, os.path.basename(macroFilePath), profile, subprofile
                 )
+            for script in macroTree.getScripts():
+                script.verifyDefaultStaleAfter(defaultStaleAfter)
+            return macroTree
         except ParseError as parseError:
             raise ConfigException(
                 f"{parseError.getSourceSpecifier()}\nfailed to parse macro tree:\n{parseError.message}",
@@ -254,12 +311,15 @@ class MidiMacros:
 
     def buildMacroTrees(self, config):
         for profile, profileConfig in config[PROFILES].items():
+            defaultStaleAfter = profileConfig[STALE_AFTER_MS] / 1000
             macroFilePath = profileConfig[GLOBAL_MACROS]
-            profileConfig[GLOBAL_MACROS] = self.buildMacroTree(macroFilePath, profile)
+            profileConfig[GLOBAL_MACROS] = self.buildMacroTree(
+                macroFilePath, defaultStaleAfter, profile
+            )
             for subprofile, subprofileConfig in profileConfig[SUBPROFILES].items():
                 macroFilePath = subprofileConfig[MACROS]
                 subprofileConfig[MACROS] = self.buildMacroTree(
-                    macroFilePath, profile, subprofile
+                    macroFilePath, defaultStaleAfter, profile, subprofile
                 )
 
     def stopListeners(self):
@@ -279,6 +339,13 @@ class MidiMacros:
     def getLoadedProfiles(self):
         return self.listeners.keys()
 
+    def getInfo(self):
+        return {
+            "script-executor": scriptExecutor.getInfo(),
+            "script-processes": processReaper.getInfo(),
+            "shell-coprocesses": shellCoprocesses.getInfo(),
+        }
+
     def tryRunListener(self, listener):
         try:
             listener.run()
@@ -364,5 +431,8 @@ try:
 except KeyboardInterrupt:
     pass
 finally:
-    midiMacros.shutdown()
-    midiMacros.unlinkExistingSocket()
+    try:
+        midiMacros.shutdown()
+        midiMacros.unlinkExistingSocket()
+    finally:
+        stopLogWriter()
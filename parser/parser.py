@@ -4,6 +4,7 @@ from log.mm_logging import loggingContext, logInfo
 from aspn import aspn
 from parser.parse_buffer import ParseBuffer
 from parser.parse_error import ParseError
+from expression.expression import PythonExpression
 from script.argument import *
 from macro.tree.macro_tree import MacroTree
 from macro.macro_error import MacroError
@@ -353,11 +354,27 @@ def parseMatchPredicate(parseBuffer):
     endPosition = parseBuffer.at()
     if startPosition == endPosition:
         generateParseError(parseBuffer, None, "empty match predicate")
-    matchPredicate = parseBuffer.stringFrom(startPosition, endPosition).strip()
+    matchPredicate = compilePythonExpression(
+        parseBuffer,
+        parseBuffer.stringFrom(startPosition, endPosition).strip(),
+        startPosition,
+        "match predicate",
+    )
     parseBuffer.skip(1)
     return matchPredicate
 
 
+def compilePythonExpression(parseBuffer, source, startPosition, expressionType):
+    try:
+        return PythonExpression(source)
+    except (SyntaxError, ValueError) as exception:
+        parseBuffer.jump(startPosition)
+        raise ParseError(
+            f"failed to compile {expressionType}: {source}, {exception}\n{parseBuffer}\n{parseBuffer.generateArrowLine()}",
+            parseBuffer,
+        )
+
+
 def parseArgumentDefinition(parseBuffer):
     if not (
         bufferHasSubstring(parseBuffer, PLAYED_NOTES_ARGUMENT_DEFINITION_SPECIFIER)
@@ -440,10 +457,12 @@ def parseArgumentProcessor(parseBuffer, namedArgumentFormats, fStringArgumentFor
             parsedArgumentSeparator = True
         atOpeningParen = parseBuffer.getCurrentChar() == "("
         if bufferHasSubstring(parseBuffer, 'f"') or bufferHasSubstring(parseBuffer, "f'") or atOpeningParen:
+            fStringStart = parseBuffer.at()
             if atOpeningParen:
                 fString = readParenthesisedStrings(parseBuffer, fStringsAllowed=True)
             else:
                 fString = readFString(parseBuffer)
+            fString = compilePythonExpression(parseBuffer, fString, fStringStart, "f-string")
             return JoiningArgumentProcessor(argumentSeparator, fStringArgumentFormatType(fString))
         else:
             namedArgumentFormatStringStart = parseBuffer.at()
@@ -741,10 +760,14 @@ def parseScriptFlags(parseBuffer):
                             f"parenthesized? f-string value for {flag}",
                             parseBuffer.getCurrentChar(),
                         )
+                    valueStart = parseBuffer.at()
                     if atOpeningParen:
                         value = readParenthesisedStrings(parseBuffer, fStringsAllowed=True)
                     else:
                         value = readFString(parseBuffer)
+                    value = compilePythonExpression(parseBuffer, value, valueStart, f"f-string value for {flag}")
+                case FlagType.INTEGER_TYPE:
+                    value = parsePositiveInteger(parseBuffer)
             keyValueFlags[flag] = value
             parseBuffer.eatWhitespace()
             parsedKeyValue = True
@@ -0,0 +1,87 @@
+"""
+Runs inside a warm python worker process, started by python_worker_pool.
+Usage: python_worker_main.py <request fd> <response fd> [module to preload...]
+Every request is a script and its input, run in a fresh namespace with the input as stdin.
+This file is run on its own, so it must not import anything from midi-macros.
+"""
+
+import builtins
+import importlib
+import io
+import json
+import os
+import struct
+import sys
+import traceback
+
+HEADER = struct.Struct(">I")
+
+
+def readExactly(fd, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def readMessage(fd):
+    header = readExactly(fd, HEADER.size)
+    if header == None:
+        return None
+    (size,) = HEADER.unpack(header)
+    body = readExactly(fd, size)
+    if body == None:
+        return None
+    return json.loads(body)
+
+
+def writeMessage(fd, message):
+    body = json.dumps(message).encode()
+    os.write(fd, HEADER.pack(len(body)) + body)
+
+
+def run(request):
+    stdin = sys.stdin
+    argv = sys.argv
+    sys.stdin = io.StringIO(request["input"] or "")
+    sys.argv = ["<script>"]
+    namespace = {"__name__": "__main__", "__builtins__": builtins}
+    try:
+        exec(compile(request["script"], "<script>", "exec"), namespace)
+        return {"error": None}
+    except SystemExit as systemExit:
+        if systemExit.code in (None, 0):
+            return {"error": None}
+        return {"error": f"script exited with status: {systemExit.code}"}
+    except BaseException:
+        return {"error": traceback.format_exc()}
+    finally:
+        sys.stdin = stdin
+        sys.argv = argv
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def main():
+    requestFd = int(sys.argv[1])
+    responseFd = int(sys.argv[2])
+    for module in sys.argv[3:]:
+        try:
+            importlib.import_module(module)
+        except Exception as exception:
+            print(
+                f"python worker could not preload module: {module}, {exception!r}",
+                file=sys.stderr,
+            )
+    while True:
+        request = readMessage(requestFd)
+        if request == None:
+            return
+        writeMessage(responseFd, run(request))
+
+
+if __name__ == "__main__":
+    main()
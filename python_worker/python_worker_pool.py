@@ -0,0 +1,254 @@
+import json
+import os
+import select
+import shlex
+import signal
+import struct
+import subprocess
+import time
+from queue import Queue
+from threading import Event, Lock, Thread
+from log.mm_logging import (
+    loggingContext,
+    getProfile,
+    getSubprofile,
+    logError,
+    exceptionStr,
+)
+
+WORKER_MAIN_PATH = os.path.join(os.path.dirname(__file__), "python_worker_main.py")
+HEADER = struct.Struct(">I")
+DEFAULT_POOL_SIZE = 2
+
+
+class PythonWorkerError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class PythonWorkerTimeoutError(PythonWorkerError):
+    pass
+
+
+class PythonWorker:
+    """
+    A python process started with the interpreter command of a script, which runs scripts sent to it over a pipe.
+    """
+
+    def __init__(self, interpreter, preload):
+        requestRead, requestWrite = os.pipe()
+        responseRead, responseWrite = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                " ".join(
+                    (
+                        interpreter,
+                        shlex.quote(WORKER_MAIN_PATH),
+                        str(requestRead),
+                        str(responseWrite),
+                        *(shlex.quote(module) for module in preload),
+                    )
+                ),
+                stdin=subprocess.DEVNULL,
+                shell=True,
+                start_new_session=True,
+                pass_fds=(requestRead, responseWrite),
+            )
+        except Exception:
+            for fd in (requestRead, requestWrite, responseRead, responseWrite):
+                os.close(fd)
+            raise
+        os.close(requestRead)
+        os.close(responseWrite)
+        self.requests = os.fdopen(requestWrite, "wb")
+        # read without buffering, so select sees every response byte that has not been read yet
+        self.responses = responseRead
+
+    def run(self, script, scriptInput, timeout=0):
+        """
+        Returns the error the script failed with, or None.
+        Raises PythonWorkerTimeoutError if the script has not finished after timeout seconds, 0 waits forever.
+        """
+        body = json.dumps({"script": script, "input": scriptInput}).encode()
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            self.requests.write(HEADER.pack(len(body)) + body)
+            self.requests.flush()
+            (size,) = HEADER.unpack(self.readResponse(HEADER.size, deadline))
+            response = self.readResponse(size, deadline)
+        except (BrokenPipeError, OSError) as exception:
+            raise PythonWorkerError(f"python worker exited, {exceptionStr(exception)}")
+        return json.loads(response)["error"]
+
+    def readResponse(self, size, deadline):
+        data = b""
+        while len(data) < size:
+            if deadline != None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select(
+                    [self.responses], [], [], remaining
+                )[0]:
+                    raise PythonWorkerTimeoutError("python worker script timed out")
+            chunk = os.read(self.responses, size - len(data))
+            if not chunk:
+                raise PythonWorkerError("python worker exited")
+            data += chunk
+        return data
+
+    def stop(self):
+        try:
+            self.requests.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        os.close(self.responses)
+
+    def kill(self):
+        """
+        Kills the worker and every process its scripts started, for a worker that hung or broke.
+        """
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        try:
+            self.requests.close()
+        except Exception:
+            pass
+        os.close(self.responses)
+
+
+class PythonJob:
+    def __init__(self, script, scriptInput, timeout, onDone):
+        self.script = script
+        self.scriptInput = scriptInput
+        self.timeout = timeout
+        self.onDone = onDone
+        self.profile = getProfile()
+        self.subprofile = getSubprofile()
+        self.done = Event()
+
+
+class PythonWorkerPool:
+    """
+    Keeps size warm python workers for one interpreter command. A worker that dies, fails or runs a script
+    past its timeout is killed and replaced, so one hung script cannot hold a worker forever.
+    """
+
+    def __init__(self, interpreter, size, preload):
+        self.interpreter = interpreter
+        self.preload = preload
+        self.jobs = Queue()
+        self.threads = [
+            Thread(target=self.workForever, daemon=True) for _ in range(size)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, script, scriptInput, wait, timeout=0, onDone=None):
+        """
+        onDone is called on the pool thread once the job has run, and must return quickly.
+        """
+        job = PythonJob(script, scriptInput, timeout, onDone)
+        self.jobs.put(job)
+        if wait:
+            job.done.wait()
+
+    def startWorker(self):
+        try:
+            return PythonWorker(self.interpreter, self.preload)
+        except Exception as exception:
+            logError(
+                f"failed to start python worker: {self.interpreter}, {exceptionStr(exception)}"
+            )
+            return None
+
+    def replaceWorker(self, worker):
+        try:
+            worker.kill()
+        except Exception as exception:
+            logError(f"failed to kill python worker: {exceptionStr(exception)}")
+        return self.startWorker()
+
+    def workForever(self):
+        worker = self.startWorker()
+        while True:
+            job = self.jobs.get()
+            # shutdown signal
+            if job == None:
+                break
+            with loggingContext(job.profile, job.subprofile):
+                try:
+                    if not worker:
+                        worker = self.startWorker()
+                    if worker:
+                        error = worker.run(job.script, job.scriptInput, job.timeout)
+                        if error:
+                            logError(f"python worker script failed:\n{error}")
+                except PythonWorkerTimeoutError:
+                    logError(
+                        f"python worker script timed out after {job.timeout * 1000:.0f} ms, starting a new worker"
+                    )
+                    worker = self.replaceWorker(worker)
+                except PythonWorkerError as pythonWorkerError:
+                    logError(f"{pythonWorkerError.message}, starting a new one")
+                    worker = self.replaceWorker(worker)
+                except Exception as exception:
+                    logError(
+                        f"python worker failed: {exceptionStr(exception)}, starting a new one"
+                    )
+                    worker = self.replaceWorker(worker)
+                finally:
+                    if job.onDone:
+                        job.onDone()
+                    job.done.set()
+        if worker:
+            worker.stop()
+
+    def shutdown(self):
+        """
+        Runs every submitted job before the workers are stopped.
+        """
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class PythonWorkerPools:
+    def __init__(self):
+        self.lock = Lock()
+        self.pools = {}
+        self.size = DEFAULT_POOL_SIZE
+        self.preload = []
+
+    def configure(self, size, preload):
+        """
+        Applies to pools started after the next shutdown.
+        """
+        with self.lock:
+            self.size = size
+            self.preload = preload
+
+    def getPool(self, interpreter):
+        with self.lock:
+            pool = self.pools.get(interpreter)
+            if not pool:
+                pool = PythonWorkerPool(interpreter, self.size, self.preload)
+                self.pools[interpreter] = pool
+            return pool
+
+    def shutdown(self):
+        with self.lock:
+            pools = self.pools
+            self.pools = {}
+        for pool in pools.values():
+            pool.shutdown()
+
+
+pythonWorkerPools = PythonWorkerPools()
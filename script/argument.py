@@ -4,6 +4,7 @@ from statistics import mean
 from abc import ABC, abstractmethod
 from aspn.aspn import midiNoteToASPN
 from log.mm_logging import logError
+from expression.expression import ExpressionVariables
 from listener.played_note import PlayedNote
 from midi.midi_message import MIDIMessage
 from midi.constants import *
@@ -37,104 +38,30 @@ class NamedArgumentFormat(ArgumentFormat):
 
 
 class FStringArgumentFormat(ArgumentFormat):
-    def __init__(self, fString):
+    def __init__(self, fString, variables):
         self.fString = fString
+        self.variables = variables
 
     def convert(self, argument, data=None):
-        return self.evaluateFString(argument, data)
-
-    @abstractmethod
-    def evaluateFString(self, argument):
-        pass
+        formattedString = self.fString.evaluateWith(
+            self.variables, globals(), argument, data
+        )
+        if not isinstance(formattedString, str):
+            raise ValueError
+        return formattedString
 
     def __str__(self):
-        return self.fString
+        return str(self.fString)
 
 
 class NotesFStringArgumentFormat(FStringArgumentFormat):
     def __init__(self, fString):
-        super().__init__(fString)
-
-    def evaluateFString(self, pn, data=None):
-        TRIGGER = data
-        PLAYED_NOTE = pn
-        MIDI = PLAYED_NOTE_FORMAT_MIDI.convert(pn)
-        ASPN = PLAYED_NOTE_FORMAT_ASPN.convert(pn)
-        ASPN_UNICODE = PLAYED_NOTE_FORMAT_ASPN_UNICODE.convert(pn)
-        PIANO = PLAYED_NOTE_FORMAT_PIANO.convert(pn)
-        VELOCITY = PLAYED_NOTE_FORMAT_VELOCITY.convert(pn)
-        TIME = PLAYED_NOTE_FORMAT_TIME.convert(pn)
-        CHANNEL = PLAYED_NOTE_FORMAT_CHANNEL.convert(pn)
-        NONE = FORMAT_NONE.convert(pn)
-        m = MIDI
-        a = ASPN
-        A = ASPN_UNICODE
-        p = PIANO
-        v = VELOCITY
-        t = TIME
-        c = CHANNEL
-        n = NONE
-        formattedString = eval(self.fString)
-        if not isinstance(formattedString, str):
-            raise ValueError
-        return formattedString
+        super().__init__(fString, PLAYED_NOTE_F_STRING_VARIABLES)
 
 
 class MIDIFStringArgumentFormat(FStringArgumentFormat):
     def __init__(self, fString):
-        super().__init__(fString)
-
-    def evaluateFString(self, message, data=None):
-        TRIGGER = data
-        MESSAGE = message
-        MESSAGE_BYTES = MIDI_MESSAGE_FORMAT_MESSAGE_BYTES.convert(message)
-        MESSAGE_BYTES_HEX = MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX.convert(message)
-        DATA_0 = MIDI_MESSAGE_FORMAT_DATA_0.convert(message)
-        DATA_1 = MIDI_MESSAGE_FORMAT_DATA_1.convert(message)
-        DATA_2 = MIDI_MESSAGE_FORMAT_DATA_2.convert(message)
-        STATUS = MIDI_MESSAGE_FORMAT_STATUS.convert(message)
-        CHANNEL = MIDI_MESSAGE_FORMAT_CHANNEL.convert(message)
-        TIME = MIDI_MESSAGE_FORMAT_TIME.convert(message)
-        STATUS_HEX = MIDI_MESSAGE_FORMAT_STATUS_HEX.convert(message)
-        CHANNEL_HEX = MIDI_MESSAGE_FORMAT_CHANNEL_HEX.convert(message)
-        DATA_0_HEX = MIDI_MESSAGE_FORMAT_DATA_0_HEX.convert(message)
-        DATA_1_HEX = MIDI_MESSAGE_FORMAT_DATA_1_HEX.convert(message)
-        DATA_2_HEX = MIDI_MESSAGE_FORMAT_DATA_2_HEX.convert(message)
-        CC_VALUE = MIDI_MESSAGE_FORMAT_CC_VALUE.convert(message)
-        CC_VALUE_PERCENT = MIDI_MESSAGE_FORMAT_CC_VALUE_PERCENT.convert(message)
-        CC_VALUE_BOOL = MIDI_MESSAGE_FORMAT_CC_VALUE_BOOL.convert(message)
-        NONE = FORMAT_NONE.convert(message)
-        CC_FUNCTION = DATA_1
-        DATA_1_SCALED = lambda minValue, maxValue: lerp(
-            (DATA_1 / 127), minValue, maxValue
-        )
-        DATA_2_SCALED = lambda minValue, maxValue: lerp(
-            (DATA_2 / 127), minValue, maxValue
-        )
-        CC_VALUE_SCALED = DATA_2_SCALED
-        m = MESSAGE
-        mbs = MESSAGE_BYTES
-        mbsh = MESSAGE_BYTES_HEX
-        d0 = DATA_0
-        d1 = DATA_1
-        d2 = DATA_2
-        s = STATUS
-        c = CHANNEL
-        t = TIME
-        sh = STATUS_HEX
-        ch = CHANNEL_HEX
-        d0h = DATA_0_HEX
-        d1h = DATA_1_HEX
-        d2h = DATA_2_HEX
-        ccvp = CC_VALUE_PERCENT
-        ccvb = CC_VALUE_BOOL
-        ccv = CC_VALUE
-        ccf = CC_FUNCTION
-        n = NONE
-        formattedString = eval(self.fString)
-        if not isinstance(formattedString, str):
-            raise ValueError
-        return formattedString
+        super().__init__(fString, MIDI_F_STRING_VARIABLES)
 
 
 PLAYED_NOTE_FORMAT_MIDI = NamedArgumentFormat(lambda pn: pn.getNote(), "MIDI")
@@ -189,6 +116,94 @@ MIDI_MESSAGE_FORMAT_CC_VALUE_BOOL = NamedArgumentFormat(
 FORMAT_NONE = NamedArgumentFormat(lambda a: "", "NONE")
 
 
+def formatVariable(argumentFormat):
+    return lambda argument, data: argumentFormat.convert(argument)
+
+
+def fStringTrigger(argument, data):
+    return data
+
+
+def fStringArgument(argument, data):
+    return argument
+
+
+def dataScaled(getData):
+    return lambda message, data: lambda minValue, maxValue: lerp(
+        (getData(message) / 127), minValue, maxValue
+    )
+
+
+PLAYED_NOTE_F_STRING_VARIABLES = ExpressionVariables(
+    {
+        "TRIGGER": fStringTrigger,
+        "PLAYED_NOTE": fStringArgument,
+        "MIDI": formatVariable(PLAYED_NOTE_FORMAT_MIDI),
+        "ASPN": formatVariable(PLAYED_NOTE_FORMAT_ASPN),
+        "ASPN_UNICODE": formatVariable(PLAYED_NOTE_FORMAT_ASPN_UNICODE),
+        "PIANO": formatVariable(PLAYED_NOTE_FORMAT_PIANO),
+        "VELOCITY": formatVariable(PLAYED_NOTE_FORMAT_VELOCITY),
+        "TIME": formatVariable(PLAYED_NOTE_FORMAT_TIME),
+        "CHANNEL": formatVariable(PLAYED_NOTE_FORMAT_CHANNEL),
+        "NONE": formatVariable(FORMAT_NONE),
+        "m": formatVariable(PLAYED_NOTE_FORMAT_MIDI),
+        "a": formatVariable(PLAYED_NOTE_FORMAT_ASPN),
+        "A": formatVariable(PLAYED_NOTE_FORMAT_ASPN_UNICODE),
+        "p": formatVariable(PLAYED_NOTE_FORMAT_PIANO),
+        "v": formatVariable(PLAYED_NOTE_FORMAT_VELOCITY),
+        "t": formatVariable(PLAYED_NOTE_FORMAT_TIME),
+        "c": formatVariable(PLAYED_NOTE_FORMAT_CHANNEL),
+        "n": formatVariable(FORMAT_NONE),
+    }
+)
+MIDI_F_STRING_VARIABLES = ExpressionVariables(
+    {
+        "TRIGGER": fStringTrigger,
+        "MESSAGE": fStringArgument,
+        "MESSAGE_BYTES": formatVariable(MIDI_MESSAGE_FORMAT_MESSAGE_BYTES),
+        "MESSAGE_BYTES_HEX": formatVariable(MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX),
+        "DATA_0": formatVariable(MIDI_MESSAGE_FORMAT_DATA_0),
+        "DATA_1": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1),
+        "DATA_2": formatVariable(MIDI_MESSAGE_FORMAT_DATA_2),
+        "STATUS": formatVariable(MIDI_MESSAGE_FORMAT_STATUS),
+        "CHANNEL": formatVariable(MIDI_MESSAGE_FORMAT_CHANNEL),
+        "TIME": formatVariable(MIDI_MESSAGE_FORMAT_TIME),
+        "STATUS_HEX": formatVariable(MIDI_MESSAGE_FORMAT_STATUS_HEX),
+        "CHANNEL_HEX": formatVariable(MIDI_MESSAGE_FORMAT_CHANNEL_HEX),
+        "DATA_0_HEX": formatVariable(MIDI_MESSAGE_FORMAT_DATA_0_HEX),
+        "DATA_1_HEX": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1_HEX),
+        "DATA_2_HEX": formatVariable(MIDI_MESSAGE_FORMAT_DATA_2_HEX),
+        "CC_VALUE": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE),
+        "CC_VALUE_PERCENT": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE_PERCENT),
+        "CC_VALUE_BOOL": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE_BOOL),
+        "NONE": formatVariable(FORMAT_NONE),
+        "CC_FUNCTION": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1),
+        "DATA_1_SCALED": dataScaled(MIDI_MESSAGE_FORMAT_DATA_1.convert),
+        "DATA_2_SCALED": dataScaled(MIDI_MESSAGE_FORMAT_DATA_2.convert),
+        "CC_VALUE_SCALED": dataScaled(MIDI_MESSAGE_FORMAT_DATA_2.convert),
+        "m": fStringArgument,
+        "mbs": formatVariable(MIDI_MESSAGE_FORMAT_MESSAGE_BYTES),
+        "mbsh": formatVariable(MIDI_MESSAGE_FORMAT_MESSAGE_BYTES_HEX),
+        "d0": formatVariable(MIDI_MESSAGE_FORMAT_DATA_0),
+        "d1": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1),
+        "d2": formatVariable(MIDI_MESSAGE_FORMAT_DATA_2),
+        "s": formatVariable(MIDI_MESSAGE_FORMAT_STATUS),
+        "c": formatVariable(MIDI_MESSAGE_FORMAT_CHANNEL),
+        "t": formatVariable(MIDI_MESSAGE_FORMAT_TIME),
+        "sh": formatVariable(MIDI_MESSAGE_FORMAT_STATUS_HEX),
+        "ch": formatVariable(MIDI_MESSAGE_FORMAT_CHANNEL_HEX),
+        "d0h": formatVariable(MIDI_MESSAGE_FORMAT_DATA_0_HEX),
+        "d1h": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1_HEX),
+        "d2h": formatVariable(MIDI_MESSAGE_FORMAT_DATA_2_HEX),
+        "ccvp": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE_PERCENT),
+        "ccvb": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE_BOOL),
+        "ccv": formatVariable(MIDI_MESSAGE_FORMAT_CC_VALUE),
+        "ccf": formatVariable(MIDI_MESSAGE_FORMAT_DATA_1),
+        "n": formatVariable(FORMAT_NONE),
+    }
+)
+
+
 class ArgumentNumberRange:
     def __init__(self, lowerBound, upperBound):
         self.lowerBound = lowerBound
@@ -257,6 +272,143 @@ class ScriptPreprocessor(ArgumentProcessor):
         )
 
 
+def triggerArgument(trigger, arguments):
+    return trigger
+
+
+def notesArgument(trigger, arguments):
+    return arguments
+
+
+def notesChannel(trigger, arguments):
+    channels = {n.getChannel() for n in arguments}
+    return tuple(channels)[0] if len(channels) == 1 else channels
+
+
+def notesStartTime(trigger, arguments):
+    return arguments[0].getTime() if len(arguments) > 0 else None
+
+
+def notesFinishTime(trigger, arguments):
+    return arguments[-1].getTime() if len(arguments) > 0 else None
+
+
+def notesElapsedTime(trigger, arguments):
+    return (
+        arguments[-1].getTime() - arguments[0].getTime()
+        if len(arguments) > 0
+        else None
+    )
+
+
+def notesMinVelocity(trigger, arguments):
+    return min(n.getVelocity() for n in arguments) if len(arguments) > 0 else None
+
+
+def notesMaxVelocity(trigger, arguments):
+    return max(n.getVelocity() for n in arguments) if len(arguments) > 0 else None
+
+
+def notesAverageVelocity(trigger, arguments):
+    return mean(n.getVelocity() for n in arguments) if len(arguments) > 0 else None
+
+
+def notesChannels(trigger, arguments):
+    return [n.getChannel() for n in arguments]
+
+
+def notesVelocities(trigger, arguments):
+    return [n.getVelocity() for n in arguments]
+
+
+def notesTimes(trigger, arguments):
+    return [n.getTime() for n in arguments]
+
+
+def notesElapsedTimes(trigger, arguments):
+    times = notesTimes(trigger, arguments)
+    return [(times[i] - times[i - 1]) if i > 0 else 0 for i in range(len(times))]
+
+
+PLAYED_NOTES_VARIABLES = ExpressionVariables(
+    {
+        "TRIGGER": triggerArgument,
+        "NOTES": notesArgument,
+        "CHANNEL": notesChannel,
+        "NOTES_START_TIME": notesStartTime,
+        "NOTES_FINISH_TIME": notesFinishTime,
+        "NOTES_ELAPSED_TIME": notesElapsedTime,
+        "NOTES_MIN_VELOCITY": notesMinVelocity,
+        "NOTES_MAX_VELOCITY": notesMaxVelocity,
+        "NOTES_AVERAGE_VELOCITY": notesAverageVelocity,
+        "CHANNELS": notesChannels,
+        "VELOCITIES": notesVelocities,
+        "TIMES": notesTimes,
+        "ELAPSED_TIMES": notesElapsedTimes,
+        "ns": notesArgument,
+        "c": notesChannel,
+        "nst": notesStartTime,
+        "nft": notesFinishTime,
+        "net": notesElapsedTime,
+        "nminv": notesMinVelocity,
+        "nmaxv": notesMaxVelocity,
+        "navgv": notesAverageVelocity,
+        "cs": notesChannels,
+        "vs": notesVelocities,
+        "ts": notesTimes,
+        "ets": notesElapsedTimes,
+    }
+)
+
+
+def messageArgument(trigger, arguments):
+    return arguments[0]
+
+
+def messageVariable(getter):
+    return lambda trigger, arguments: getter(arguments[0])
+
+
+MIDI_MESSAGE_VARIABLES = ExpressionVariables(
+    {
+        "TRIGGER": triggerArgument,
+        "MESSAGE": messageArgument,
+        "DATA_0": messageVariable(MIDIMessage.getData0),
+        "DATA_1": messageVariable(MIDIMessage.getData1),
+        "DATA_2": messageVariable(MIDIMessage.getData2),
+        "STATUS": messageVariable(MIDIMessage.getStatus),
+        "CHANNEL": messageVariable(MIDIMessage.getChannel),
+        "TIME": messageVariable(MIDIMessage.getTime),
+        "CC_VALUE": messageVariable(MIDIMessage.getData2),
+        "CC_FUNCTION": messageVariable(MIDIMessage.getData1),
+        "m": messageArgument,
+        "d0": messageVariable(MIDIMessage.getData0),
+        "d1": messageVariable(MIDIMessage.getData1),
+        "d2": messageVariable(MIDIMessage.getData2),
+        "s": messageVariable(MIDIMessage.getStatus),
+        "c": messageVariable(MIDIMessage.getChannel),
+        "t": messageVariable(MIDIMessage.getTime),
+        "ccv": messageVariable(MIDIMessage.getData2),
+        "ccf": messageVariable(MIDIMessage.getData1),
+    }
+)
+
+
+UNCONSTRAINED = object()
+DISPATCH_FIELDS = (
+    ("STATUS", "s"),
+    ("CHANNEL", "c"),
+    ("DATA_1", "d1", "CC_FUNCTION", "ccf"),
+)
+DISPATCH_FIELD_NAMES = {
+    name: field for field, names in enumerate(DISPATCH_FIELDS) for name in names
+}
+
+
+def getMessageDispatchKey(message):
+    return (message.getStatus(), message.getChannel(), message.getData1())
+
+
 PLAYED_NOTES_ARGUMENT_DEFINITION_SPECIFIER = "NOTES"
 MIDI_ARGUMENT_DEFINITION_SPECIFIER = "MIDI"
 
@@ -364,39 +516,9 @@ class PlayedNotesArgumentDefinition(ArgumentDefinition):
         return PLAYED_NOTES_ARGUMENT_DEFINITION_SPECIFIER
 
     def testMatchPredicate(self, matchPredicate, trigger, arguments):
-        TRIGGER = trigger
-        NOTES = arguments
-        CHANNEL = {n.getChannel() for n in NOTES}
-        CHANNEL = tuple(CHANNEL)[0] if len(CHANNEL) == 1 else CHANNEL
-        NOTES_START_TIME = NOTES_FINISH_TIME = NOTES_ELAPSED_TIME = (
-            NOTES_MIN_VELOCITY
-        ) = NOTES_MAX_VELOCITY = NOTES_AVERAGE_VELOCITY = None
-        if len(arguments) > 0:
-            NOTES_START_TIME = NOTES[0].getTime()
-            NOTES_FINISH_TIME = NOTES[-1].getTime()
-            NOTES_ELAPSED_TIME = NOTES_FINISH_TIME - NOTES_START_TIME
-            NOTES_MIN_VELOCITY = min(n.getVelocity() for n in NOTES)
-            NOTES_MAX_VELOCITY = max(n.getVelocity() for n in NOTES)
-            NOTES_AVERAGE_VELOCITY = mean(n.getVelocity() for n in NOTES)
-        CHANNELS = [n.getChannel() for n in NOTES]
-        VELOCITIES = [n.getVelocity() for n in NOTES]
-        TIMES = [n.getTime() for n in NOTES]
-        ELAPSED_TIMES = [
-            (TIMES[i] - TIMES[i - 1]) if i > 0 else 0 for i in range(len(TIMES))
-        ]
-        ns = NOTES
-        c = CHANNEL
-        nst = NOTES_START_TIME
-        nft = NOTES_FINISH_TIME
-        net = NOTES_ELAPSED_TIME
-        nminv = NOTES_MIN_VELOCITY
-        nmaxv = NOTES_MAX_VELOCITY
-        navgv = NOTES_AVERAGE_VELOCITY
-        cs = CHANNELS
-        vs = VELOCITIES
-        ts = TIMES
-        ets = ELAPSED_TIMES
-        if eval(matchPredicate):
+        if matchPredicate.evaluateWith(
+            PLAYED_NOTES_VARIABLES, globals(), trigger, arguments
+        ):
             return True
         return False
 
@@ -413,31 +535,41 @@ class MIDIMessageArgumentDefinition(ArgumentDefinition):
             argumentNumberRange=SINGLE_ARGUMENT_NUMBER_RANGE,
             matchPredicates=matchPredicates,
         )
+        self.dispatchKey = self.findDispatchKey()
+
+    def findDispatchKey(self):
+        constants = {
+            name: value
+            for name, value in globals().items()
+            if isinstance(value, int) and name not in MIDI_MESSAGE_VARIABLES.getNames()
+        }
+        dispatchKey = [UNCONSTRAINED] * len(DISPATCH_FIELDS)
+        for matchPredicate in self.matchPredicates:
+            for name, value in matchPredicate.getEqualityConstraints(
+                DISPATCH_FIELD_NAMES, constants
+            ):
+                field = DISPATCH_FIELD_NAMES[name]
+                if dispatchKey[field] is UNCONSTRAINED:
+                    dispatchKey[field] = value
+                elif dispatchKey[field] != value:
+                    # predicates can never all be true
+                    return None
+        return tuple(dispatchKey)
+
+    def getDispatchKey(self):
+        """
+        (STATUS, CHANNEL, DATA_1) values a message must have to match, or UNCONSTRAINED.
+        None if no message can match.
+        """
+        return self.dispatchKey
 
     def getIdentifier(self):
         return "MIDI"
 
     def testMatchPredicate(self, matchPredicate, trigger, arguments):
-        TRIGGER = trigger
-        MESSAGE = arguments[0]
-        DATA_0 = MESSAGE.getData0()
-        DATA_1 = MESSAGE.getData1()
-        DATA_2 = MESSAGE.getData2()
-        STATUS = MESSAGE.getStatus()
-        CHANNEL = MESSAGE.getChannel()
-        TIME = MESSAGE.getTime()
-        CC_VALUE = DATA_2
-        CC_FUNCTION = DATA_1
-        m = MESSAGE
-        d0 = DATA_0
-        d1 = DATA_1
-        d2 = DATA_2
-        s = STATUS
-        c = CHANNEL
-        t = TIME
-        ccv = CC_VALUE
-        ccf = CC_FUNCTION
-        if eval(matchPredicate):
+        if matchPredicate.evaluateWith(
+            MIDI_MESSAGE_VARIABLES, globals(), trigger, arguments
+        ):
             return True
         return False
 
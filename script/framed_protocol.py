@@ -0,0 +1,40 @@
+"""
+The protocol FRAMED background scripts read from stdin: one JSON object per line.
+    {"arguments": <processed arguments, or null without an argument processor or invocation format>,
+     "trigger": [<note>...], "events": [<note or message>...]}
+A note is {"note", "channel", "velocity", "time"} and a MIDI message is {"status", "channel", "data", "time"},
+where data holds every byte of the message and time is in nanoseconds.
+"""
+
+import json
+from listener.played_note import PlayedNote
+
+
+def encodeEvent(event):
+    if isinstance(event, PlayedNote):
+        return {
+            "note": event.getNote(),
+            "channel": event.getChannel(),
+            "velocity": event.getVelocity(),
+            "time": event.getTime(),
+        }
+    return {
+        "status": event.getStatus(),
+        "channel": event.getChannel(),
+        "data": list(event.getMessage()),
+        "time": event.getTime(),
+    }
+
+
+def encodeFrame(trigger, arguments, scriptInput):
+    return (
+        json.dumps(
+            {
+                "arguments": scriptInput,
+                "trigger": [encodeEvent(note) for note in trigger],
+                "events": [encodeEvent(event) for event in arguments],
+            },
+            separators=(",", ":"),
+        )
+        + "\n"
+    )
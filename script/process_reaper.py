@@ -0,0 +1,253 @@
+import errno
+import os
+import select
+import time
+from threading import Condition, Lock, Thread
+from log.mm_logging import loggingContext, logDebug, logError, exceptionStr
+
+# used for processes without a pidfd
+POLL_INTERVAL = 0.05
+
+
+class ProcessStats:
+    def __init__(self):
+        self.running = 0
+        self.started = 0
+        self.exited = 0
+        self.failed = 0
+        self.timedOut = 0
+        self.totalWallTime = 0
+        self.maxWallTime = 0
+
+    def getInfo(self):
+        return {
+            "running": self.running,
+            "started": self.started,
+            "exited": self.exited,
+            "failed": self.failed,
+            "timed-out": self.timedOut,
+            "average-wall-ms": (
+                self.totalWallTime / self.exited * 1000 if self.exited else 0
+            ),
+            "max-wall-ms": self.maxWallTime * 1000,
+        }
+
+
+class TrackedProcess:
+    def __init__(self, process, profile, subprofile, onExit):
+        self.process = process
+        self.profile = profile
+        self.subprofile = subprofile
+        self.onExit = onExit
+        self.startTime = time.monotonic()
+        self.pidfd = None
+
+
+class ProcessReaper:
+    """
+    Waits on every process started for a script invocation on one shared thread, so no process is left a zombie,
+    and records how each of them exited. Scripts take a slot before they start a process, or before they hand a
+    script to a python worker or shell coprocess, which blocks while the global or per-profile limit of running
+    scripts is reached. A limit of 0 means no limit.
+    Tracked processes are only ever reaped here, so signalProcessGroup cannot signal a reused process group.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.slotFreed = Condition(self.lock)
+        self.maxRunning = 0
+        self.maxRunningPerProfile = {}
+        # profile -> seconds before a script process is killed, 0 to never kill
+        self.defaultTimeout = {}
+        self.running = 0
+        self.stats = {}
+        # pidfd -> TrackedProcess
+        self.tracked = {}
+        # pid -> TrackedProcess, for processes without a pidfd, which are polled
+        self.polled = {}
+        self.usePidfd = hasattr(os, "pidfd_open")
+        self.poller = select.poll() if self.usePidfd else None
+        self.wakeRead, self.wakeWrite = os.pipe()
+        if self.poller:
+            self.poller.register(self.wakeRead, select.POLLIN)
+        self.reaperThread = None
+
+    def configure(self, maxRunning, maxRunningPerProfile):
+        with self.lock:
+            self.maxRunning = maxRunning
+            self.maxRunningPerProfile = maxRunningPerProfile
+            self.slotFreed.notify_all()
+
+    def setDefaultTimeout(self, defaultTimeout):
+        with self.lock:
+            self.defaultTimeout = defaultTimeout
+
+    def getDefaultTimeout(self, profile):
+        return self.defaultTimeout.get(profile, 0)
+
+    def countTimeout(self, profile):
+        with self.lock:
+            self.getStats(profile).timedOut += 1
+
+    def getStats(self, profile):
+        stats = self.stats.get(profile)
+        if not stats:
+            stats = ProcessStats()
+            self.stats[profile] = stats
+        return stats
+
+    def isLimited(self, profile):
+        return bool(self.maxRunning or self.maxRunningPerProfile.get(profile, 0))
+
+    def isFull(self, profile):
+        maxRunningForProfile = self.maxRunningPerProfile.get(profile, 0)
+        return (self.maxRunning and self.running >= self.maxRunning) or (
+            maxRunningForProfile
+            and self.getStats(profile).running >= maxRunningForProfile
+        )
+
+    def acquireSlot(self, profile):
+        """
+        Call track with the started process, or releaseSlot if it could not be started.
+        """
+        with self.lock:
+            while self.isFull(profile):
+                self.slotFreed.wait()
+            self.running += 1
+            self.getStats(profile).running += 1
+
+    def releaseSlot(self, profile):
+        with self.lock:
+            self.running -= 1
+            self.getStats(profile).running -= 1
+            self.slotFreed.notify_all()
+
+    def track(self, process, profile, subprofile=None, onExit=None):
+        """
+        onExit is called on the reaper thread once the process has exited, and must return quickly.
+        """
+        trackedProcess = TrackedProcess(process, profile, subprofile, onExit)
+        alreadyExited = False
+        pidfdError = None
+        with self.lock:
+            self.getStats(profile).started += 1
+            if not self.reaperThread:
+                self.reaperThread = Thread(target=self.reapForever, daemon=True)
+                self.reaperThread.start()
+            try:
+                if self.usePidfd:
+                    trackedProcess.pidfd = os.pidfd_open(process.pid)
+            except ProcessLookupError:
+                alreadyExited = True
+            except OSError as exception:
+                # out of file descriptors, or not supported by the kernel
+                pidfdError = exception
+                if exception.errno == errno.ENOSYS:
+                    self.usePidfd = False
+            if trackedProcess.pidfd != None:
+                self.tracked[trackedProcess.pidfd] = trackedProcess
+                self.poller.register(trackedProcess.pidfd, select.POLLIN)
+            elif not alreadyExited:
+                self.polled[process.pid] = trackedProcess
+        if alreadyExited:
+            # already gone, so there is nothing to wait for
+            self.reap(trackedProcess)
+            return
+        if pidfdError:
+            with loggingContext(profile, subprofile):
+                logDebug(
+                    lambda: f"could not open a pidfd for script process: {process.pid}, polling it instead, {exceptionStr(pidfdError)}"
+                )
+        os.write(self.wakeWrite, b"\0")
+
+    def reap(self, trackedProcess):
+        wallTime = time.monotonic() - trackedProcess.startTime
+        with self.lock:
+            # the process has exited, so this does not block
+            returnCode = trackedProcess.process.wait()
+            self.running -= 1
+            stats = self.getStats(trackedProcess.profile)
+            stats.running -= 1
+            stats.exited += 1
+            stats.totalWallTime += wallTime
+            if wallTime > stats.maxWallTime:
+                stats.maxWallTime = wallTime
+            if returnCode != 0:
+                stats.failed += 1
+            self.slotFreed.notify_all()
+        with loggingContext(trackedProcess.profile, trackedProcess.subprofile):
+            if returnCode != 0:
+                logDebug(
+                    lambda: f"script process: {trackedProcess.process.pid}, exited with status: {returnCode} after {wallTime * 1000:.1f} ms"
+                )
+            if trackedProcess.onExit:
+                try:
+                    trackedProcess.onExit()
+                except Exception as exception:
+                    logError(
+                        f"failed to clean up after script process: {trackedProcess.process.pid}, {exceptionStr(exception)}"
+                    )
+
+    def signalProcessGroup(self, process, signalNumber):
+        """
+        Scripts are started in a new session, so the group of a script process is its pid.
+        Only signals a tracked process that has not been reaped, so its pid cannot have been reused.
+        Returns whether the group was signalled.
+        """
+        with self.lock:
+            if process.returncode != None:
+                return False
+            try:
+                os.killpg(process.pid, signalNumber)
+                return True
+            except ProcessLookupError:
+                return False
+
+    def takeExited(self):
+        with self.lock:
+            timeout = POLL_INTERVAL if self.polled else None
+        exited = []
+        if self.poller:
+            for fd, _ in self.poller.poll(timeout * 1000 if timeout else None):
+                if fd == self.wakeRead:
+                    os.read(self.wakeRead, 4096)
+                    continue
+                with self.lock:
+                    trackedProcess = self.tracked.pop(fd)
+                    self.poller.unregister(fd)
+                os.close(fd)
+                exited.append(trackedProcess)
+        elif select.select([self.wakeRead], [], [], timeout)[0]:
+            os.read(self.wakeRead, 4096)
+        with self.lock:
+            exited += [
+                self.polled.pop(pid)
+                for pid, trackedProcess in list(self.polled.items())
+                if trackedProcess.process.poll() != None
+            ]
+        return exited
+
+    def reapForever(self):
+        while True:
+            try:
+                for trackedProcess in self.takeExited():
+                    self.reap(trackedProcess)
+            except Exception as exception:
+                logError(f"failed to reap script processes: {exceptionStr(exception)}")
+
+    def getInfo(self):
+        with self.lock:
+            return {
+                "running": self.running,
+                "max-running": self.maxRunning,
+                "profiles": {
+                    profile: {
+                        **stats.getInfo(),
+                        "max-running": self.maxRunningPerProfile.get(profile, 0),
+                    }
+                    for profile, stats in self.stats.items()
+                },
+            }
+
+
+processReaper = ProcessReaper()
@@ -0,0 +1,95 @@
+import time
+from threading import Lock
+from script.timer_scheduler import timerScheduler
+
+
+class Throttle:
+    """
+    Releases an invocation straight away if none was released in the last interval. Otherwise the latest
+    invocation is held and released once the interval has passed, so the final invocation is always delivered.
+    release is called with the invocation and whether it was held.
+    """
+
+    def __init__(self, interval, release):
+        self.interval = interval
+        self.release = release
+        self.lock = Lock()
+        self.lastRelease = None
+        self.pending = None
+        self.timer = None
+
+    def submit(self, invocation):
+        with self.lock:
+            now = time.monotonic()
+            if self.timer == None and (
+                self.lastRelease == None or now - self.lastRelease >= self.interval
+            ):
+                self.lastRelease = now
+                self.release(invocation, False)
+                return
+            self.pending = invocation
+            if self.timer == None:
+                self.timer = timerScheduler.schedule(
+                    self.lastRelease + self.interval, self.releasePending
+                )
+
+    def releasePending(self):
+        with self.lock:
+            self.timer = None
+            if self.pending == None:
+                return
+            self.lastRelease = time.monotonic()
+            invocation, self.pending = self.pending, None
+            self.release(invocation, True)
+
+    def flush(self):
+        with self.lock:
+            if self.timer:
+                timerScheduler.cancel(self.timer)
+                self.timer = None
+            if self.pending != None:
+                invocation, self.pending = self.pending, None
+                self.release(invocation, True)
+
+
+class Debounce:
+    """
+    Holds the latest invocation and releases it once no other invocation has been submitted for delay seconds.
+    release is called with the invocation and whether it was held, which it always is.
+    """
+
+    def __init__(self, delay, release):
+        self.delay = delay
+        self.release = release
+        self.lock = Lock()
+        self.deadline = None
+        self.pending = None
+        self.timer = None
+
+    def submit(self, invocation):
+        with self.lock:
+            self.pending = invocation
+            self.deadline = time.monotonic() + self.delay
+            # a running timer is pushed back when it fires instead of being rescheduled on every submit
+            if self.timer == None:
+                self.timer = timerScheduler.schedule(self.deadline, self.releasePending)
+
+    def releasePending(self):
+        with self.lock:
+            self.timer = None
+            if self.pending == None:
+                return
+            if time.monotonic() < self.deadline:
+                self.timer = timerScheduler.schedule(self.deadline, self.releasePending)
+                return
+            invocation, self.pending = self.pending, None
+            self.release(invocation, True)
+
+    def flush(self):
+        with self.lock:
+            if self.timer:
+                timerScheduler.cancel(self.timer)
+                self.timer = None
+            if self.pending != None:
+                invocation, self.pending = self.pending, None
+                self.release(invocation, True)
@@ -1,13 +1,25 @@
 import subprocess
-import tempfile
 import os
+import signal
+import time
+from threading import Event, Lock
+from contextlib import nullcontext
 from enum import Enum, auto
-from threading import Thread
-from queue import Queue, Empty
 from script.argument import *
-from log.mm_logging import loggingContext, logError, exceptionStr
+from expression.expression import ExpressionVariables
+from log.mm_logging import loggingContext, logDebug, logError, exceptionStr
 from locking.locking import lockContext
 from script.script_error import ScriptError
+from script.simple_command import parseSimpleCommand
+from script.script_file import ScriptFile
+from script.framed_protocol import encodeFrame
+from script.rate_limit import Throttle, Debounce
+from script.script_executor import scriptExecutor
+from script.timer_scheduler import timerScheduler
+from script.process_reaper import processReaper
+from listener.timeline import getTimelineTime, getCurrentEventTime
+from python_worker.python_worker_pool import pythonWorkerPools
+from shell_coprocess.shell_coprocess import shellCoprocesses, ShellCoprocessError
 
 NONE = 0
 BLOCK = 2**0
@@ -16,6 +28,10 @@ SCRIPT_PATH_AS_ENV_VAR = 2**2
 BACKGROUND = 2**3
 KILL = 2**4
 PERMIT_EXTRA = 2**5
+PYTHON_WORKER = 2**6
+SHELL_COPROCESS = 2**7
+RESTART = 2**8
+FRAMED = 2**9
 
 BLOCK_KEY = "BLOCK"
 DEBOUNCE_KEY = "DEBOUNCE"
@@ -23,6 +39,10 @@ SCRIPT_PATH_AS_ENV_VAR_KEY = "SCRIPT_PATH_AS_ENV_VAR"
 BACKGROUND_KEY = "BACKGROUND"
 KILL_KEY = "KILL"
 PERMIT_EXTRA_KEY = "PERMIT_EXTRA"
+PYTHON_WORKER_KEY = "PYTHON_WORKER"
+SHELL_COPROCESS_KEY = "SHELL_COPROCESS"
+RESTART_KEY = "RESTART"
+FRAMED_KEY = "FRAMED"
 
 FLAGS = {
     BLOCK_KEY: BLOCK,
@@ -31,23 +51,47 @@ FLAGS = {
     BACKGROUND_KEY: BACKGROUND,
     KILL_KEY: KILL,
     PERMIT_EXTRA_KEY: PERMIT_EXTRA,
+    PYTHON_WORKER_KEY: PYTHON_WORKER,
+    SHELL_COPROCESS_KEY: SHELL_COPROCESS,
+    RESTART_KEY: RESTART,
+    FRAMED_KEY: FRAMED,
 }
 LOCK = "LOCK"
 INVOCATION_FORMAT = "INVOCATION_FORMAT"
+THROTTLE = "THROTTLE"
+DEBOUNCE_MS = "DEBOUNCE_MS"
+STALE_AFTER = "STALE_AFTER"
+TIMEOUT = "TIMEOUT"
+BATCH = "BATCH"
 
 
 class FlagType(Enum):
     STRING_TYPE = auto()
     FSTRING_TYPE = auto()
+    INTEGER_TYPE = auto()
 
 
 KEY_VALUE_FLAGS = {
     LOCK: FlagType.STRING_TYPE,
     INVOCATION_FORMAT: FlagType.FSTRING_TYPE,
+    THROTTLE: FlagType.INTEGER_TYPE,
+    DEBOUNCE_MS: FlagType.INTEGER_TYPE,
+    STALE_AFTER: FlagType.INTEGER_TYPE,
+    TIMEOUT: FlagType.INTEGER_TYPE,
+    BATCH: FlagType.INTEGER_TYPE,
 }
 SCRIPT_PATH_ENV_VAR = "MM_SCRIPT"
 
 
+def invocationArguments(arguments):
+    return arguments
+
+
+INVOCATION_FORMAT_VARIABLES = ExpressionVariables(
+    {"ARGUMENTS": invocationArguments, "a": invocationArguments}
+)
+
+
 class Script:
     def __init__(
         self,
@@ -66,8 +110,13 @@ class Script:
         self.interpreter = interpreter
         self.profile = profile
         self.subprofile = subprofile
-        self.invocationQueue = Queue()
-        self.invocationThread = None
+        self.invocationLane = scriptExecutor.createLane(self.runInvocations)
+        self.initialized = False
+        self.scriptFile = None
+        self.environment = None
+        # the process RESTART terminates when a newer invocation arrives
+        self.runningProcess = None
+        self.runningProcessLock = Lock()
         self.locks = (
             self.keyValueFlags[LOCK].split(",") if LOCK in self.keyValueFlags else []
         )
@@ -78,14 +127,24 @@ class Script:
         )
         self.isPreprocessed = isinstance(self.argumentDefinition.getArgumentProcessor(), ScriptPreprocessor)
         self.hasMIDIArgumentDefinition = isinstance(self.argumentDefinition, MIDIMessageArgumentDefinition)
-        self.argumentsOverSTDIN = (
+        self.shouldProcessArguments = (
             argumentDefinition.shouldProcessArguments()
             or self.invocationFormat != None
-        ) and not self.isPreprocessed
+        )
+        # a FRAMED script always reads its invocations from stdin, even without processed arguments
+        self.argumentsOverSTDIN = (
+            self.shouldProcessArguments and not self.isPreprocessed
+        ) or bool(self.flags & FRAMED)
         self.scriptPathAsEnvVar = self.flags & SCRIPT_PATH_AS_ENV_VAR or (
             self.interpreter and self.argumentsOverSTDIN
         )
         self.scriptOverSTDIN = self.interpreter and not self.scriptPathAsEnvVar
+        # a preprocessed script only has its final text at invocation time, so it always goes through /bin/sh
+        self.simpleCommand = (
+            parseSimpleCommand(self.script)
+            if not self.interpreter and not self.isPreprocessed
+            else None
+        )
         if self.flags & BACKGROUND:
             if self.isPreprocessed:
                 raise ScriptError(
@@ -101,6 +160,11 @@ class Script:
                 )
             if self.locks:
                 raise ScriptError(f"{BACKGROUND_KEY} script cannot be used with {LOCK}")
+        if self.flags & FRAMED:
+            if not self.flags & BACKGROUND:
+                raise ScriptError(
+                    f"{FRAMED_KEY} can only be used on {BACKGROUND_KEY} scripts"
+                )
         if self.flags & KILL:
             if not self.flags & BACKGROUND:
                 raise ScriptError(
@@ -111,17 +175,111 @@ class Script:
                 raise ScriptError(
                     f"{PERMIT_EXTRA_KEY} cannot be used with MIDI argument definitions"
                 )
+        if self.flags & PYTHON_WORKER:
+            if not self.interpreter:
+                raise ScriptError(
+                    f"{PYTHON_WORKER_KEY} requires the python interpreter command"
+                )
+            if self.flags & BACKGROUND:
+                raise ScriptError(
+                    f"{PYTHON_WORKER_KEY} cannot be used with {BACKGROUND_KEY} enabled"
+                )
+            if self.flags & SCRIPT_PATH_AS_ENV_VAR:
+                raise ScriptError(
+                    f"{PYTHON_WORKER_KEY} cannot be used with {SCRIPT_PATH_AS_ENV_VAR_KEY} enabled"
+                )
+        if self.flags & SHELL_COPROCESS:
+            if self.interpreter:
+                raise ScriptError(
+                    f"{SHELL_COPROCESS_KEY} cannot be used with an interpreter command"
+                )
+            if self.flags & BACKGROUND:
+                raise ScriptError(
+                    f"{SHELL_COPROCESS_KEY} cannot be used with {BACKGROUND_KEY} enabled"
+                )
+            if self.flags & SCRIPT_PATH_AS_ENV_VAR:
+                raise ScriptError(
+                    f"{SHELL_COPROCESS_KEY} cannot be used with {SCRIPT_PATH_AS_ENV_VAR_KEY} enabled"
+                )
+        if TIMEOUT in self.keyValueFlags:
+            for flag, flagKey in (
+                (BACKGROUND, BACKGROUND_KEY),
+                (SHELL_COPROCESS, SHELL_COPROCESS_KEY),
+            ):
+                if self.flags & flag:
+                    raise ScriptError(f"{TIMEOUT} cannot be used with {flagKey} enabled")
+        # None uses the default of the profile, 0 never times out
+        self.timeout = (
+            self.keyValueFlags[TIMEOUT] / 1000 if TIMEOUT in self.keyValueFlags else None
+        )
+        self.batchSize = self.keyValueFlags.get(BATCH)
+        if self.batchSize != None:
+            if self.batchSize <= 0:
+                raise ScriptError(f"{BATCH} must be greater than 0")
+            if not self.argumentsOverSTDIN:
+                raise ScriptError(f"{BATCH} requires arguments passed over stdin")
+            for flag, flagKey in (
+                (BACKGROUND, BACKGROUND_KEY),
+                (DEBOUNCE, DEBOUNCE_KEY),
+                (RESTART, RESTART_KEY),
+            ):
+                if self.flags & flag:
+                    raise ScriptError(f"{BATCH} cannot be used with {flagKey} enabled")
+        if self.flags & RESTART:
+            for flag, flagKey in (
+                (BACKGROUND, BACKGROUND_KEY),
+                (PYTHON_WORKER, PYTHON_WORKER_KEY),
+                (SHELL_COPROCESS, SHELL_COPROCESS_KEY),
+            ):
+                if self.flags & flag:
+                    raise ScriptError(
+                        f"{RESTART_KEY} cannot be used with {flagKey} enabled"
+                    )
+        self.rateLimit = self.createRateLimit()
+        # None uses the default of the profile, 0 never drops
+        self.staleAfter = (
+            self.keyValueFlags[STALE_AFTER] / 1000
+            if STALE_AFTER in self.keyValueFlags
+            else None
+        )
+        if self.staleAfter and not self.outlastsDebounce(self.staleAfter):
+            raise ScriptError(f"{STALE_AFTER} must be greater than {DEBOUNCE_MS}")
+
+    def outlastsDebounce(self, staleAfter):
+        # a debounced invocation runs DEBOUNCE_MS after its event at the earliest, which would always be stale
+        return staleAfter * 1000 > self.keyValueFlags.get(DEBOUNCE_MS, 0)
+
+    def verifyDefaultStaleAfter(self, defaultStaleAfter):
+        """
+        The profile's stale-after-ms applies to scripts without STALE_AFTER, so it must suit them too.
+        """
+        if (
+            self.staleAfter == None
+            and defaultStaleAfter
+            and not self.outlastsDebounce(defaultStaleAfter)
+        ):
+            raise ScriptError(
+                f"stale-after-ms must be greater than {DEBOUNCE_MS} of script:\n{self}"
+            )
+
+    def createRateLimit(self):
+        if THROTTLE in self.keyValueFlags and DEBOUNCE_MS in self.keyValueFlags:
+            raise ScriptError(f"{THROTTLE} cannot be used with {DEBOUNCE_MS}")
+        for flag, rateLimitType in ((THROTTLE, Throttle), (DEBOUNCE_MS, Debounce)):
+            if flag not in self.keyValueFlags:
+                continue
+            milliseconds = self.keyValueFlags[flag]
+            if milliseconds <= 0:
+                raise ScriptError(f"{flag} must be greater than 0")
+            return rateLimitType(milliseconds / 1000, self.submitInvocation)
+        return None
 
     def lazyInitialize(self):
-        if self.invocationThread:
+        if self.initialized:
             return
         if self.flags & BACKGROUND:
-            (
-                self.backgroundProcess,
-                self.backgroundScriptPath,
-            ) = self.spawnBackgroundProcess()
-        self.invocationThread = Thread(target=self.invokeForever, daemon=True)
-        self.invocationThread.start()
+            self.backgroundProcess = self.spawnBackgroundProcess()
+        self.initialized = True
 
     def getScript(self):
         return self.script
@@ -141,55 +299,115 @@ class Script:
     def getLocks(self):
         return self.locks
 
-    def invokeForever(self):
+    def hasMIDIMessageArgumentDefinition(self):
+        return self.hasMIDIArgumentDefinition
+
+    def runInvocations(self, invocations):
         with loggingContext(self.profile, self.subprofile):
-            shuttingDown = False
-            while True:
-                invocations = [self.invocationQueue.get()]
-                try:
-                    while True:
-                        invocations.append(self.invocationQueue.get_nowait())
-                except Empty:
-                    pass
-                # shutdown signal
-                if invocations[-1] == None:
-                    if len(invocations) == 1:
-                        self.invocationQueue.task_done()
-                        break
-                    del invocations[-1]
-                    shuttingDown = True
-                if self.flags & DEBOUNCE:
-                    self.invoke(invocations[-1])
-                else:
-                    for invocation in invocations:
-                        self.invoke(invocation)
-                for _ in range(len(invocations)):
-                    self.invocationQueue.task_done()
-                if shuttingDown:
-                    self.invocationQueue.task_done()
-                    break
-
-    def removeScriptFile(self, scriptPath):
+            staleAfter = (
+                self.staleAfter
+                if self.staleAfter != None
+                else scriptExecutor.getDefaultStaleAfter(self.profile)
+            )
+            if self.batchSize:
+                self.invokeBatches(invocations, staleAfter)
+                return
+            if self.flags & FRAMED:
+                self.sendFrames(invocations, staleAfter)
+                return
+            if self.flags & DEBOUNCE:
+                # like a held THROTTLE or DEBOUNCE_MS release, the final invocation is never stale
+                _, invocation = invocations[-1]
+                self.invoke(invocation)
+                return
+            if self.flags & RESTART:
+                invocations = (invocations[-1],)
+            for _, invocation in invocations:
+                # checked right before each invocation, since the ones before it may have blocked for a while
+                if self.dropIfStale(invocation, staleAfter):
+                    continue
+                self.invoke(invocation)
+
+    def invokeBatches(self, invocations, staleAfter):
+        """
+        Writes the processed arguments of up to batchSize invocations to one process, one record per line.
+        """
+        batch = []
+        for _, invocation in invocations:
+            if self.dropIfStale(invocation, staleAfter):
+                continue
+            trigger, arguments, _ = invocation
+            record = self.processScriptInput(trigger, arguments)
+            if record == None:
+                continue
+            batch.append(record if record.endswith("\n") else f"{record}\n")
+            if len(batch) == self.batchSize:
+                self.runProcess(self.script, "".join(batch))
+                batch = []
+        if batch:
+            self.runProcess(self.script, "".join(batch))
+
+    def sendFrames(self, invocations, staleAfter):
+        """
+        Every invocation taken from the lane in one pass is sent to the background process with a single write.
+        """
+        frames = []
+        for _, invocation in invocations:
+            if self.dropIfStale(invocation, staleAfter):
+                continue
+            trigger, arguments, _ = invocation
+            scriptInput = None
+            if self.shouldProcessArguments:
+                scriptInput = self.processScriptInput(trigger, arguments)
+                if scriptInput == None:
+                    continue
+            frames.append(encodeFrame(trigger, arguments, scriptInput))
+        if not frames or not self.backgroundProcess or not self.backgroundProcess.stdin:
+            return
         try:
-            os.remove(scriptPath)
+            self.backgroundProcess.stdin.write("".join(frames))
+            self.backgroundProcess.stdin.flush()
+        except Exception as exception:
+            logError(
+                f"failed to send arguments to background process: {exceptionStr(exception)}"
+            )
+
+    def dropIfStale(self, invocation, staleAfter):
+        """
+        The age of an invocation is measured from the time it was stamped with in queue.
+        Invocations held back by THROTTLE or DEBOUNCE_MS are never stale, so the final one is always delivered.
+        """
+        _, _, staleFrom = invocation
+        if not staleAfter or staleFrom == None:
+            return False
+        age = (getTimelineTime() - staleFrom) / 1e9
+        if age <= staleAfter:
+            return False
+        scriptExecutor.countStale()
+        logDebug(lambda: f"dropped stale invocation after {age * 1000:.1f} ms")
+        return True
+
+    def closeScriptFile(self, scriptFile):
+        try:
+            scriptFile.close()
         except FileNotFoundError:
             pass
         except Exception as exception:
             logError(
-                f"could not remove script file: {scriptPath}, {exceptionStr(exception)}"
+                f"could not remove script file: {scriptFile.getPath()}, {exceptionStr(exception)}"
             )
 
     def shutdown(self):
         """
         Make sure all invocations of this script have been queued, and no more invocations will ever be queued, before calling this function.
         """
-        if not self.invocationThread:
+        if not self.initialized:
             return
-        # signals to shutdown
-        self.invocationQueue.put(None)
-        self.invocationQueue.join()
-        self.invocationThread.join()
-        self.invocationThread = None
+        # deliver invocations still held back by THROTTLE or DEBOUNCE_MS
+        if self.rateLimit:
+            self.rateLimit.flush()
+        self.invocationLane.waitUntilIdle()
+        self.initialized = False
         if self.flags & BACKGROUND and self.backgroundProcess:
             if self.backgroundProcess.stdin and self.argumentsOverSTDIN:
                 try:
@@ -201,71 +419,230 @@ class Script:
             else:
                 self.backgroundProcess.kill()
             self.backgroundProcess.wait()
-            if self.backgroundScriptPath:
-                self.removeScriptFile(self.backgroundScriptPath)
+        if self.scriptFile:
+            self.closeScriptFile(self.scriptFile)
+            self.scriptFile = None
+            self.environment = None
 
     def spawnProcess(self, script):
+        """
+        Returns the process and its temporary script file, which must be removed once the process has exited.
+        """
         env = None
-        scriptPath = None
+        scriptFile = None
         if self.scriptPathAsEnvVar:
-            env = os.environ.copy()
-            scriptFile = tempfile.NamedTemporaryFile(mode="w", delete=False)
-            scriptFile.write(script)
-            scriptFile.close()
-            scriptPath = scriptFile.name
-            env[SCRIPT_PATH_ENV_VAR] = scriptPath
-        process = subprocess.Popen(
-            self.interpreter if self.interpreter else script,
-            stdin=(
-                subprocess.PIPE
-                if self.scriptOverSTDIN or self.argumentsOverSTDIN
-                else None
-            ),
-            text=True,
-            shell=True,
-            start_new_session=True,
-            env=env,
-        )
+            # the environment and the script file are only created once, unless the script is preprocessed
+            if self.environment == None:
+                self.environment = os.environ.copy()
+            if self.isPreprocessed:
+                scriptFile = ScriptFile(script, False)
+                env = {**self.environment, SCRIPT_PATH_ENV_VAR: scriptFile.getPath()}
+            else:
+                if not self.scriptFile:
+                    self.scriptFile = ScriptFile(self.script, True)
+                    self.environment[SCRIPT_PATH_ENV_VAR] = self.scriptFile.getPath()
+                scriptFile = self.scriptFile
+                env = self.environment
+        if self.simpleCommand:
+            command = self.simpleCommand
+        else:
+            command = self.interpreter if self.interpreter else script
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=(
+                    subprocess.PIPE
+                    if self.scriptOverSTDIN or self.argumentsOverSTDIN
+                    else None
+                ),
+                text=True,
+                shell=not self.simpleCommand,
+                start_new_session=True,
+                env=env,
+                pass_fds=scriptFile.getPassFds() if scriptFile else (),
+            )
+        except Exception:
+            if scriptFile and scriptFile is not self.scriptFile:
+                self.closeScriptFile(scriptFile)
+            raise
+        # the process has its own copy of a memfd, so only a temporary file outlives the spawn
+        if scriptFile and scriptFile is not self.scriptFile and not scriptFile.isTemporary():
+            self.closeScriptFile(scriptFile)
         if process.stdin and self.scriptOverSTDIN:
             process.stdin.write(script)
             process.stdin.close()
-        return process, scriptPath
+        return process, scriptFile if scriptFile and scriptFile.isTemporary() else None
 
     def spawnBackgroundProcess(self):
-        backgroundProcess = None
-        scriptPath = None
         try:
-            backgroundProcess, scriptPath = self.spawnProcess(self.script)
+            backgroundProcess, _ = self.spawnProcess(self.script)
+            return backgroundProcess
         except Exception as exception:
             logError(f"failed to start background process: {exceptionStr(exception)}")
-        return backgroundProcess, scriptPath
+        return None
 
     def runProcess(self, processedScript, processedInput=None):
-        with lockContext(self.locks):
+        if self.flags & PYTHON_WORKER:
+            self.runInPythonWorker(processedScript, processedInput)
+            return
+        if self.flags & SHELL_COPROCESS:
+            self.runInShellCoprocess(processedScript, processedInput)
+            return
+        with self.blockingContext(), lockContext(self.locks):
             try:
-                process, scriptPath = self.spawnProcess(processedScript)
+                processReaper.acquireSlot(self.profile)
+                try:
+                    process, scriptFile = self.spawnProcess(processedScript)
+                except Exception:
+                    processReaper.releaseSlot(self.profile)
+                    raise
+                # only the reaper reaps the process, a BLOCK invocation waits until the reaper has
+                exited = Event() if self.flags & BLOCK else None
+                timeout = self.getTimeout()
+                # scheduled before the process is tracked, so it exists when the process exits
+                timeoutTimer = (
+                    timerScheduler.schedule(
+                        time.monotonic() + timeout,
+                        lambda: self.killTimedOutProcess(process, timeout),
+                    )
+                    if timeout and not exited
+                    else None
+                )
+
+                def onExit():
+                    if timeoutTimer:
+                        timerScheduler.cancel(timeoutTimer)
+                    if scriptFile:
+                        self.closeScriptFile(scriptFile)
+                    if exited:
+                        exited.set()
+
+                processReaper.track(process, self.profile, self.subprofile, onExit)
+                if self.flags & RESTART:
+                    self.setRunningProcess(process)
                 if process.stdin and self.argumentsOverSTDIN and processedInput:
                     process.stdin.write(processedInput)
                     process.stdin.close()
-                if self.flags & BLOCK:
-                    process.wait()
-                    if scriptPath:
-                        self.removeScriptFile(scriptPath)
+                if exited and not exited.wait(timeout or None):
+                    self.killTimedOutProcess(process, timeout)
+                    exited.wait()
+            except Exception as exception:
+                logError(f"failed to run script: {exceptionStr(exception)}")
+
+    def blockingContext(self):
+        """
+        Invocations run on the shared executor workers, which must not all be taken by invocations
+        that wait on their process, a LOCK or a running script slot.
+        """
+        if self.flags & BLOCK or self.locks or processReaper.isLimited(self.profile):
+            return scriptExecutor.blocking()
+        return nullcontext()
+
+    def getTimeout(self):
+        return (
+            self.timeout
+            if self.timeout != None
+            else processReaper.getDefaultTimeout(self.profile)
+        )
+
+    def killTimedOutProcess(self, process, timeout):
+        with loggingContext(self.profile, self.subprofile):
+            try:
+                if not processReaper.signalProcessGroup(process, signal.SIGKILL):
+                    return
+            except Exception as exception:
+                logError(f"failed to kill timed out process: {exceptionStr(exception)}")
+                return
+            processReaper.countTimeout(self.profile)
+            logError(
+                f"script timed out after {timeout * 1000:.0f} ms, killed process: {process.pid}"
+            )
+
+    def setRunningProcess(self, process):
+        with self.runningProcessLock:
+            self.runningProcess = process
+        # an invocation that arrived while this process was being started did not see it
+        if self.invocationLane.hasPending():
+            self.terminateRunningProcess()
+
+    def terminateRunningProcess(self):
+        with self.runningProcessLock:
+            process, self.runningProcess = self.runningProcess, None
+        if not process:
+            return
+        try:
+            if processReaper.signalProcessGroup(process, signal.SIGTERM):
+                logDebug(
+                    lambda: f"terminated process: {process.pid}, for a newer invocation"
+                )
+        except Exception as exception:
+            logError(f"failed to terminate process: {exceptionStr(exception)}")
+
+    def runInPythonWorker(self, processedScript, processedInput=None):
+        with self.blockingContext(), lockContext(self.locks):
+            # the slot is held until the worker has run the script, like a process started for it
+            processReaper.acquireSlot(self.profile)
+            try:
+                pythonWorkerPools.getPool(self.interpreter).submit(
+                    processedScript,
+                    processedInput if self.argumentsOverSTDIN else None,
+                    self.flags & BLOCK,
+                    self.getTimeout(),
+                    lambda: processReaper.releaseSlot(self.profile),
+                )
             except Exception as exception:
+                processReaper.releaseSlot(self.profile)
+                logError(f"failed to run script: {exceptionStr(exception)}")
+
+    def runInShellCoprocess(self, processedScript, processedInput=None):
+        with self.blockingContext(), lockContext(self.locks):
+            # the slot is held until the shell reports that the script has exited
+            processReaper.acquireSlot(self.profile)
+            try:
+                shellCoprocesses.getCoprocess(self.profile).run(
+                    processedScript,
+                    processedInput if self.argumentsOverSTDIN else None,
+                    self.flags & BLOCK,
+                    lambda: processReaper.releaseSlot(self.profile),
+                )
+            except ShellCoprocessError as shellCoprocessError:
+                processReaper.releaseSlot(self.profile)
+                logError(f"failed to run script: {shellCoprocessError.message}")
+            except Exception as exception:
+                processReaper.releaseSlot(self.profile)
                 logError(f"failed to run script: {exceptionStr(exception)}")
 
     def formatArguments(self, arguments):
         if not self.invocationFormat:
             return arguments
-        ARGUMENTS = arguments
-        a = ARGUMENTS
-        formattedArguments = eval(self.invocationFormat)
+        formattedArguments = self.invocationFormat.evaluateWith(
+            INVOCATION_FORMAT_VARIABLES, globals(), arguments
+        )
         if not isinstance(formattedArguments, str):
             raise ValueError
         return formattedArguments
 
+    def logArgumentProcessingError(self, exception):
+        logError(
+            f"failed to process arguments with argument processor: {self.argumentDefinition.getArgumentProcessor()} and invocation format: {self.invocationFormat}\nreason: {exception}"
+        )
+
+    def processScriptInput(self, trigger, arguments):
+        """
+        Only for scripts that take their arguments over stdin. Returns None if the arguments could not be processed.
+        """
+        try:
+            return self.formatArguments(
+                self.argumentDefinition.processArguments(trigger, arguments)
+                if self.argumentDefinition.shouldProcessArguments()
+                else ""
+            )
+        except Exception as exception:
+            self.logArgumentProcessingError(exception)
+            return None
+
     def invoke(self, context):
-        trigger, arguments = context
+        trigger, arguments, _ = context
         if (
             not self.argumentDefinition.shouldProcessArguments()
             and self.invocationFormat == None
@@ -289,9 +666,7 @@ class Script:
                     self.runProcess(processedScript)
                     return
         except Exception as exception:
-            logError(
-                f"failed to process arguments with argument processor: {self.argumentDefinition.getArgumentProcessor()} and invocation format: {self.invocationFormat}\nreason: {exception}"
-            )
+            self.logArgumentProcessingError(exception)
             return
         if self.flags & BACKGROUND and self.backgroundProcess:
             if self.backgroundProcess.stdin:
@@ -312,9 +687,30 @@ class Script:
             return
         self.queue(trigger, arguments)
 
+    def submitInvocation(self, invocation, held=False):
+        if self.flags & RESTART:
+            self.terminateRunningProcess()
+        if held:
+            trigger, arguments, _ = invocation
+            invocation = (trigger, arguments, None)
+        self.invocationLane.submit(invocation)
+
     def queue(self, trigger, arguments):
+        """
+        The invocation is stamped with the time of the MIDI event being handled, which is the one that triggered it,
+        or with the current time if it was not triggered by a MIDI event.
+        """
         self.lazyInitialize()
-        self.invocationQueue.put((trigger, arguments))
+        staleFrom = getCurrentEventTime()
+        invocation = (
+            trigger,
+            arguments,
+            staleFrom if staleFrom != None else getTimelineTime(),
+        )
+        if self.rateLimit:
+            self.rateLimit.submit(invocation)
+            return
+        self.submitInvocation(invocation)
 
     def __str__(self):
         argumentDefinitionSpecification = f"{self.argumentDefinition} "
@@ -0,0 +1,183 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, Condition, Thread
+from log.mm_logging import logError, exceptionStr
+
+DEFAULT_MAX_WORKERS = 32
+
+
+class ScriptLane:
+    """
+    The pending invocations of one script. A lane is run by at most one worker at a time,
+    so a script's invocations run in the order they were submitted.
+    runInvocations is called with (submit time, invocation) pairs, submit times are from time.monotonic.
+    """
+
+    def __init__(self, executor, runInvocations):
+        self.executor = executor
+        self.runInvocations = runInvocations
+        # (submit time, invocation)
+        self.pending = deque()
+        self.scheduled = False
+
+    def submit(self, invocation):
+        self.executor.submit(self, invocation)
+
+    def waitUntilIdle(self):
+        self.executor.waitUntilIdle(self)
+
+    def hasPending(self):
+        with self.executor.lock:
+            return bool(self.pending)
+
+
+class ScriptExecutor:
+    """
+    Runs script invocations on a bounded pool of worker threads shared by every script.
+    Workers are started on demand up to maxWorkers, and exit while idle if maxWorkers is lowered.
+    A worker inside blocking() does not count toward maxWorkers, so scripts waiting on their process, a LOCK
+    or a running script slot cannot starve the others. Every lane is run by at most one worker, so there are
+    never more blocked workers than scripts.
+    """
+
+    def __init__(self, maxWorkers=DEFAULT_MAX_WORKERS):
+        self.maxWorkers = maxWorkers
+        self.lock = Lock()
+        self.workAvailable = Condition(self.lock)
+        self.laneIdle = Condition(self.lock)
+        self.readyLanes = deque()
+        self.numWorkers = 0
+        self.idleWorkers = 0
+        self.blockedWorkers = 0
+        self.queuedInvocations = 0
+        self.startedInvocations = 0
+        self.totalWait = 0
+        self.maxWait = 0
+        self.staleInvocations = 0
+        # profile -> seconds an invocation may wait before it is dropped, 0 to never drop
+        self.defaultStaleAfter = {}
+
+    def createLane(self, runInvocations):
+        return ScriptLane(self, runInvocations)
+
+    def setMaxWorkers(self, maxWorkers):
+        with self.lock:
+            self.maxWorkers = maxWorkers
+            self.workAvailable.notify_all()
+
+    def setDefaultStaleAfter(self, defaultStaleAfter):
+        with self.lock:
+            self.defaultStaleAfter = defaultStaleAfter
+
+    def getDefaultStaleAfter(self, profile):
+        return self.defaultStaleAfter.get(profile, 0)
+
+    def countStale(self):
+        with self.lock:
+            self.staleInvocations += 1
+
+    def submit(self, lane, invocation):
+        with self.lock:
+            lane.pending.append((time.monotonic(), invocation))
+            self.queuedInvocations += 1
+            if lane.scheduled:
+                return
+            lane.scheduled = True
+            self.readyLanes.append(lane)
+            if self.idleWorkers:
+                self.workAvailable.notify()
+            else:
+                self.startWorkerIfAllowed()
+
+    def startWorkerIfAllowed(self):
+        if self.numWorkers - self.blockedWorkers < self.maxWorkers:
+            self.numWorkers += 1
+            Thread(target=self.workForever, daemon=True).start()
+
+    @contextmanager
+    def blocking(self):
+        """
+        Wraps a wait of the calling worker, during which another worker may be started for the ready lanes.
+        """
+        with self.lock:
+            self.blockedWorkers += 1
+            if self.readyLanes and not self.idleWorkers:
+                self.startWorkerIfAllowed()
+        try:
+            yield None
+        finally:
+            with self.lock:
+                self.blockedWorkers -= 1
+
+    def waitUntilIdle(self, lane):
+        with self.lock:
+            while lane.scheduled:
+                self.laneIdle.wait()
+
+    def takeReadyLane(self):
+        """
+        Returns None once this worker should exit.
+        """
+        with self.lock:
+            while True:
+                # a worker started while another was blocked exits once that one is running again
+                if self.numWorkers - self.blockedWorkers > self.maxWorkers:
+                    self.numWorkers -= 1
+                    return None, None
+                if self.readyLanes:
+                    break
+                self.idleWorkers += 1
+                self.workAvailable.wait()
+                self.idleWorkers -= 1
+            lane = self.readyLanes.popleft()
+            pending = lane.pending
+            lane.pending = deque()
+            now = time.monotonic()
+            for submitTime, _ in pending:
+                wait = now - submitTime
+                self.totalWait += wait
+                if wait > self.maxWait:
+                    self.maxWait = wait
+            self.queuedInvocations -= len(pending)
+            self.startedInvocations += len(pending)
+            return lane, pending
+
+    def workForever(self):
+        while True:
+            lane, invocations = self.takeReadyLane()
+            if not lane:
+                return
+            try:
+                lane.runInvocations(invocations)
+            except Exception as exception:
+                logError(f"failed to run script invocations: {exceptionStr(exception)}")
+            with self.lock:
+                if lane.pending:
+                    # go to the back of the line so one busy script cannot starve the rest
+                    self.readyLanes.append(lane)
+                else:
+                    lane.scheduled = False
+                    self.laneIdle.notify_all()
+
+    def getInfo(self):
+        with self.lock:
+            return {
+                "workers": self.numWorkers,
+                "max-workers": self.maxWorkers,
+                "busy-workers": self.numWorkers - self.idleWorkers,
+                "blocked-workers": self.blockedWorkers,
+                "ready-scripts": len(self.readyLanes),
+                "queued-invocations": self.queuedInvocations,
+                "started-invocations": self.startedInvocations,
+                "average-wait-ms": (
+                    self.totalWait / self.startedInvocations * 1000
+                    if self.startedInvocations
+                    else 0
+                ),
+                "max-wait-ms": self.maxWait * 1000,
+                "stale-invocations": self.staleInvocations,
+            }
+
+
+scriptExecutor = ScriptExecutor()
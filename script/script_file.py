@@ -0,0 +1,134 @@
+import atexit
+import fcntl
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+from threading import Lock
+
+SCRIPT_FILE_DIR = "midi-macros"
+scriptFileDir = None
+scriptFileDirLock = Lock()
+SEALS = getattr(fcntl, "F_SEAL_SEAL", 0) | getattr(fcntl, "F_SEAL_SHRINK", 0) | getattr(
+    fcntl, "F_SEAL_GROW", 0
+) | getattr(fcntl, "F_SEAL_WRITE", 0)
+
+
+def createSealedMemfd(script):
+    fd = os.memfd_create("midi-macros-script", os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+    try:
+        data = script.encode()
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        fcntl.fcntl(fd, fcntl.F_ADD_SEALS, SEALS)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+def isPrivate(path, fileType, mode=None):
+    try:
+        status = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return (
+        stat.S_IFMT(status.st_mode) == fileType
+        and status.st_uid == os.getuid()
+        and not status.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+        and (mode == None or stat.S_IMODE(status.st_mode) == mode)
+    )
+
+
+def getScriptFileDir():
+    """
+    Content-addressed files are only reused from a directory that no other user can write to, so a shared
+    directory that is not owned by this user with mode 0700 is replaced by a private one for this process.
+    """
+    global scriptFileDir
+    with scriptFileDirLock:
+        if scriptFileDir:
+            return scriptFileDir
+        runtimeDir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        sharedDir = os.path.join(runtimeDir, SCRIPT_FILE_DIR)
+        try:
+            os.mkdir(sharedDir, mode=0o700)
+        except FileExistsError:
+            pass
+        if isPrivate(sharedDir, stat.S_IFDIR, 0o700):
+            scriptFileDir = sharedDir
+        else:
+            scriptFileDir = tempfile.mkdtemp(prefix=f"{SCRIPT_FILE_DIR}-")
+            atexit.register(shutil.rmtree, scriptFileDir, ignore_errors=True)
+        return scriptFileDir
+
+
+def writeContentAddressedFile(script):
+    data = script.encode()
+    path = os.path.join(getScriptFileDir(), hashlib.sha256(data).hexdigest())
+    if isPrivate(path, stat.S_IFREG):
+        return path
+    # written under a temporary name first so a reader never sees a partial file
+    scriptFile = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False)
+    try:
+        scriptFile.write(data)
+        scriptFile.close()
+        os.replace(scriptFile.name, path)
+    except Exception:
+        scriptFile.close()
+        os.remove(scriptFile.name)
+        raise
+    return path
+
+
+def writeTemporaryFile(script):
+    scriptFile = tempfile.NamedTemporaryFile(mode="w", delete=False)
+    scriptFile.write(script)
+    scriptFile.close()
+    return scriptFile.name
+
+
+class ScriptFile:
+    """
+    A script body that child processes can read from getPath. A sealed memfd is used where the platform has one,
+    and is passed to the child as /dev/fd/<fd>. Otherwise a persistent body is written once to a content-addressed file
+    in $XDG_RUNTIME_DIR, and any other body to a temporary file that must be removed once its process has exited.
+    """
+
+    def __init__(self, script, persistent):
+        self.fd = None
+        self.temporary = False
+        if hasattr(os, "memfd_create"):
+            try:
+                self.fd = createSealedMemfd(script)
+            except OSError:
+                pass
+        if self.fd != None:
+            self.path = f"/dev/fd/{self.fd}"
+        elif persistent:
+            self.path = writeContentAddressedFile(script)
+        else:
+            self.path = writeTemporaryFile(script)
+            self.temporary = True
+
+    def getPath(self):
+        return self.path
+
+    def getPassFds(self):
+        return (self.fd,) if self.fd != None else ()
+
+    def isTemporary(self):
+        return self.temporary
+
+    def close(self):
+        """
+        Processes that were already started keep their own copy of the memfd.
+        """
+        if self.fd != None:
+            os.close(self.fd)
+            self.fd = None
+        if self.temporary:
+            os.remove(self.path)
+            self.temporary = False
@@ -0,0 +1,69 @@
+import shlex
+
+# a script containing any of these needs /bin/sh to run the way it was written
+SHELL_METACHARACTERS = set("|&;<>()$`\\*?[]{}~#!\n")
+SHELL_BUILTINS = set(
+    (
+        ".",
+        ":",
+        "alias",
+        "bg",
+        "break",
+        "case",
+        "cd",
+        "command",
+        "continue",
+        "do",
+        "done",
+        "elif",
+        "else",
+        "esac",
+        "eval",
+        "exec",
+        "exit",
+        "export",
+        "fg",
+        "fi",
+        "for",
+        "function",
+        "getopts",
+        "hash",
+        "if",
+        "jobs",
+        "local",
+        "read",
+        "readonly",
+        "return",
+        "set",
+        "shift",
+        "source",
+        "then",
+        "times",
+        "trap",
+        "type",
+        "ulimit",
+        "umask",
+        "unalias",
+        "unset",
+        "until",
+        "wait",
+        "while",
+    )
+)
+
+
+def parseSimpleCommand(script):
+    """
+    Returns the arguments of a script that is a single command with plain arguments, so it can be executed without /bin/sh.
+    Returns None for every other script.
+    """
+    script = script.strip()
+    if not script or any(character in SHELL_METACHARACTERS for character in script):
+        return None
+    try:
+        arguments = shlex.split(script)
+    except ValueError:
+        return None
+    if not arguments or arguments[0] in SHELL_BUILTINS or "=" in arguments[0]:
+        return None
+    return arguments
@@ -0,0 +1,56 @@
+import heapq
+import time
+from itertools import count
+from threading import Condition, Thread
+from log.mm_logging import logError, exceptionStr
+
+
+class TimerScheduler:
+    """
+    Runs callbacks at monotonic deadlines on one shared thread.
+    Callbacks must return quickly, since they delay every timer due after them.
+    """
+
+    def __init__(self):
+        # [deadline, sequence, callback], callback is None once cancelled
+        self.timers = []
+        self.sequence = count()
+        self.condition = Condition()
+        self.schedulerThread = None
+
+    def schedule(self, deadline, callback):
+        timer = [deadline, next(self.sequence), callback]
+        with self.condition:
+            if not self.schedulerThread:
+                self.schedulerThread = Thread(target=self.runForever, daemon=True)
+                self.schedulerThread.start()
+            heapq.heappush(self.timers, timer)
+            if self.timers[0] is timer:
+                self.condition.notify()
+        return timer
+
+    def cancel(self, timer):
+        with self.condition:
+            timer[2] = None
+
+    def runForever(self):
+        while True:
+            with self.condition:
+                while True:
+                    while self.timers and self.timers[0][2] == None:
+                        heapq.heappop(self.timers)
+                    if not self.timers:
+                        self.condition.wait()
+                        continue
+                    delay = self.timers[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                _, _, callback = heapq.heappop(self.timers)
+            try:
+                callback()
+            except Exception as exception:
+                logError(f"timer callback failed: {exceptionStr(exception)}")
+
+
+timerScheduler = TimerScheduler()
@@ -0,0 +1,177 @@
+import fcntl
+import os
+import shlex
+from threading import Event, Lock, Thread
+
+SHELL_PATH = "/bin/sh"
+# the shell reports finished commands that are waited on on this fd, user commands run with it closed
+MARKER_FD = 3
+# a copy of the stdin of midi-macros, which user commands without input read like processes started with Popen
+INPUT_FD = 4
+
+
+def getInputFd():
+    """
+    Above the fds the shell is given, so spawning it cannot overwrite the copy before it is moved to INPUT_FD.
+    """
+    try:
+        return fcntl.fcntl(0, fcntl.F_DUPFD_CLOEXEC, INPUT_FD + 1)
+    except OSError:
+        # stdin is closed
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        try:
+            return fcntl.fcntl(devnull, fcntl.F_DUPFD_CLOEXEC, INPUT_FD + 1)
+        finally:
+            os.close(devnull)
+
+
+class ShellCoprocessError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class ShellCoprocess:
+    """
+    A long-lived shell that reads commands from a pipe and runs each of them in a forked subshell,
+    so a command only costs a fork of the shell and the exec of the command itself.
+    """
+
+    def __init__(self):
+        inputFd = getInputFd()
+        commandRead, commandWrite = os.pipe()
+        markerRead, markerWrite = os.pipe()
+        try:
+            self.pid = os.posix_spawn(
+                SHELL_PATH,
+                [SHELL_PATH, "-s"],
+                os.environ,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, commandRead, 0),
+                    (os.POSIX_SPAWN_DUP2, markerWrite, MARKER_FD),
+                    (os.POSIX_SPAWN_DUP2, inputFd, INPUT_FD),
+                ],
+                setsid=True,
+            )
+        except Exception:
+            for fd in (commandRead, commandWrite, markerRead, markerWrite, inputFd):
+                os.close(fd)
+            raise
+        os.close(commandRead)
+        os.close(markerWrite)
+        os.close(inputFd)
+        self.commands = os.fdopen(commandWrite, "wb")
+        self.markers = os.fdopen(markerRead, "rb")
+        self.lock = Lock()
+        # command id -> called once that command has exited
+        self.waiting = {}
+        self.nextCommandId = 0
+        self.exited = False
+        self.markerThread = Thread(target=self.readMarkersForever, daemon=True)
+        self.markerThread.start()
+
+    def isAlive(self):
+        with self.lock:
+            if not self.exited:
+                self.exited = os.waitpid(self.pid, os.WNOHANG)[0] != 0
+            return not self.exited
+
+    def run(self, script, scriptInput, wait, onExit=None):
+        """
+        The script runs in its own subshell, so it cannot change the state of the coprocess.
+        onExit is called on the marker thread once the script has exited, and must return quickly.
+        """
+        command = f"( eval {shlex.quote(script)} )"
+        if scriptInput != None:
+            command = f"printf %s {shlex.quote(scriptInput)} | {command} {MARKER_FD}>&- {INPUT_FD}<&-"
+        else:
+            command = f"{command} <&{INPUT_FD} {MARKER_FD}>&- {INPUT_FD}<&-"
+        done = Event() if wait else None
+
+        def notifyExit():
+            if onExit:
+                onExit()
+            if done:
+                done.set()
+
+        reportExit = wait or onExit
+        with self.lock:
+            if reportExit:
+                commandId = self.nextCommandId
+                self.nextCommandId += 1
+                self.waiting[commandId] = notifyExit
+                command = f"{command}; echo {commandId} >&{MARKER_FD}"
+            # the outer subshell exits straight away, so the shell never has to reap the command
+            try:
+                self.commands.write(f"( ( {command} ) & )\n".encode())
+                self.commands.flush()
+            except OSError as exception:
+                if reportExit:
+                    del self.waiting[commandId]
+                raise ShellCoprocessError(f"shell coprocess exited, {exception}")
+        if done:
+            done.wait()
+
+    def readMarkersForever(self):
+        for line in self.markers:
+            with self.lock:
+                notifyExit = self.waiting.pop(int(line), None)
+            if notifyExit:
+                notifyExit()
+        # the shell and every reported command have exited, nothing else will be reported
+        with self.lock:
+            waiting = self.waiting
+            self.waiting = {}
+        for notifyExit in waiting.values():
+            notifyExit()
+        self.markers.close()
+
+    def stop(self):
+        """
+        The shell exits once it has read every command, commands that are still running are left alone.
+        """
+        try:
+            self.commands.close()
+        except Exception:
+            pass
+        with self.lock:
+            if not self.exited:
+                os.waitpid(self.pid, 0)
+                self.exited = True
+
+
+class ShellCoprocesses:
+    def __init__(self):
+        self.lock = Lock()
+        self.coprocesses = {}
+
+    def getCoprocess(self, profile):
+        """
+        Starts a new coprocess for the profile if it has none, or if its shell has exited.
+        """
+        with self.lock:
+            coprocess = self.coprocesses.get(profile)
+            if coprocess and coprocess.isAlive():
+                return coprocess
+            if coprocess:
+                coprocess.stop()
+            coprocess = ShellCoprocess()
+            self.coprocesses[profile] = coprocess
+            return coprocess
+
+    def getInfo(self):
+        with self.lock:
+            return {
+                "running": sum(
+                    coprocess.isAlive() for coprocess in self.coprocesses.values()
+                )
+            }
+
+    def shutdown(self):
+        with self.lock:
+            coprocesses = self.coprocesses
+            self.coprocesses = {}
+        for coprocess in coprocesses.values():
+            coprocess.stop()
+
+
+shellCoprocesses = ShellCoprocesses()